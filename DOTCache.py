@@ -0,0 +1,98 @@
+"""
+Persistent cache of parsed dot files.
+
+The cache stores the statements DOTScanner.scan() (or the ANTLR parser) read
+from each file, before any settings are applied. Filtering, level truncation
+and colouring are done when the statements are replayed into a DOTReader, so
+changing settings.yaml or the command line does not invalidate the cache.
+
+Entries are keyed by path. A file whose modification time and size are
+unchanged is trusted without reading it. Otherwise its content hash is
+compared, which catches the common case of Doxygen rewriting a file with the
+same content.
+
+A cache can be used from several threads.
+"""
+
+import hashlib
+import logging
+import marshal
+import os
+import sqlite3
+import threading
+
+# Increase when the format of the stored statements changes.
+CACHE_VERSION = 1
+
+
+class DOTCache:
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta '
+                '(key TEXT PRIMARY KEY, value TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS files '
+                '(path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, '
+                'digest TEXT, statements BLOB)')
+        row = self._db.execute("SELECT value FROM meta WHERE key='version'") \
+                .fetchone()
+        if row is None or row[0] != str(CACHE_VERSION):
+            logging.info('Cache %s has old format, clearing it', path)
+            self._db.execute('DELETE FROM files')
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                    (str(CACHE_VERSION),))
+        self._pending = {} # Stat and digest of files that were not found
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fname):
+        """
+        Returns the cached statements of the file or None if the file has
+        changed or is not in the cache.
+        """
+        with self._lock:
+            return self._get(fname)
+
+    def _get(self, fname):
+        st = os.stat(fname)
+        row = self._db.execute('SELECT mtime_ns, size, digest, statements '
+                'FROM files WHERE path=?', (fname,)).fetchone()
+        if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            self.hits += 1
+            return marshal.loads(row[3])
+        digest = _digest(fname)
+        if row is not None and row[2] == digest:
+            self._db.execute('UPDATE files SET mtime_ns=?, size=? WHERE path=?',
+                    (st.st_mtime_ns, st.st_size, fname))
+            self.hits += 1
+            return marshal.loads(row[3])
+        self._pending[fname] = (st.st_mtime_ns, st.st_size, digest)
+        self.misses += 1
+        return None
+
+    def put(self, fname, statements):
+        """
+        Stores the statements of a file after a get() that returned None.
+        """
+        with self._lock:
+            mtime_ns, size, digest = self._pending.pop(fname)
+            self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                    (fname, mtime_ns, size, digest, marshal.dumps(statements)))
+
+    def commit(self):
+        """
+        Saves the entries added so far.
+        """
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+        logging.info('Cache: %s hits, %s misses', self.hits, self.misses)
+
+
+def _digest(fname):
+    with open(fname, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
@@ -0,0 +1,225 @@
+"""
+Library API for combining dot files inside another program, e.g. a server
+that builds many graphs:
+
+    config = Config.load('settings.yaml')
+    combiner = Combiner(config, level=0, filter=True)
+    for fname in files:
+        combiner.add_file(fname)
+    combiner.write(sys.stdout, 'dot')
+
+All state is kept in the Combiner, so any number of them can be used at the
+same time, also from different threads. A Config compiles the settings once
+(the filter patterns and the package pattern) and can be shared by all
+Combiners. The clean-up functions here are the ones dotcomb.py uses.
+"""
+
+import fnmatch
+import logging
+import threading
+
+import DOTScanner
+from DOTFilter import DOTFilter
+from DOTGraph import DOTGraph, BatchGraph, EdgeIndex
+from DOTPackage import PackageResolver
+from DOTReader import DOTReader
+from DOTWriter import DOTWriter, BUFFER_SIZE
+
+# The generated ANTLR parser keeps its DFA caches in class attributes, shared
+# by all parsers.
+_antlr_lock = threading.Lock()
+
+
+def load_settings(fname='settings.yaml', alt_fname=''):
+    """
+    Reads a settings file, and a file with settings that replace some of
+    them.
+    """
+    import yaml
+    with open(fname, 'r') as f:
+        settings = yaml.safe_load(f)
+    if alt_fname != '':
+        with open(alt_fname, 'r') as f:
+            settings = {**settings, **yaml.safe_load(f)}
+    return settings
+
+
+def filter_edges(graph, show_node):
+    """
+    Returns the edges of a DOTGraph whose both ends are nodes accepted by
+    show_node, and an EdgeIndex of them.
+    """
+    nodes = graph.nodes
+    cleaned_edges = {}
+    cleaned_index = EdgeIndex()
+    for (n1, n2), edge in graph.edges.items():
+        if show_node(n1) and show_node(n2):
+            if (n1 in nodes) and (n2 in nodes):
+                cleaned_edges[(n1, n2)] = edge
+                cleaned_index.add(n1, n2)
+    return cleaned_edges, cleaned_index
+
+
+def clean_nodes(nodes, index):
+    """
+    Returns the nodes that have edges in the EdgeIndex.
+    """
+    return {key: node for key, node in nodes.items() if index.has_edges(key)}
+
+
+def focus_graph(nodes, index, edges, patterns, hops, direction='both'):
+    """
+    Returns the nodes, EdgeIndex and edges within hops of the nodes whose
+    labels without quotes match any of the patterns, and the number of
+    those nodes.
+    """
+    start = [label for label in nodes if any([fnmatch.fnmatchcase(
+        label.replace('"', ''), p) for p in patterns])]
+    keep = index.neighbourhood(start, hops, direction)
+    focused_edges = {key: edge for key, edge in edges.items()
+            if key[0] in keep and key[1] in keep}
+    focused_index = EdgeIndex(focused_edges)
+    return (clean_nodes(nodes, focused_index), focused_index, focused_edges,
+            len(start))
+
+
+def reduce_edges(edges, index):
+    """
+    Removes the edges that the transitive reduction removes from edges and
+    the EdgeIndex. Returns their number.
+    """
+    from DOTReduce import redundant_edges
+    removed = redundant_edges(edges)
+    for key in removed:
+        del edges[key]
+        index.remove(*key)
+    return len(removed)
+
+
+class Config:
+    """
+    Settings compiled for Combiners.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.packages = PackageResolver(settings)
+        self._filters = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, fname='settings.yaml', alt_fname=''):
+        return cls(load_settings(fname, alt_fname))
+
+    def node_filter(self, enabled):
+        """
+        Returns the DOTFilter, with filtering enabled or not.
+        """
+        with self._lock:
+            node_filter = self._filters.get(enabled)
+            if node_filter is None:
+                node_filter = DOTFilter(self.settings, enabled)
+                self._filters[enabled] = node_filter
+        return node_filter
+
+
+class Combiner:
+    """
+    Combines dot files into one graph. The arguments are those of the
+    command line options with the same names. config is a Config or a
+    settings dict.
+    """
+
+    def __init__(self, config, level=4, filter=False, bidir=False,
+            cluster=False, header='', merge='incremental'):
+        if not isinstance(config, Config):
+            config = Config(config)
+        self.config = config
+        self.params = {'level': level, 'filter': filter, 'bidir': bidir,
+                'cluster': cluster, 'header': header, 'format': 'dot',
+                'buffer_size': BUFFER_SIZE}
+        self.graph = BatchGraph(bidir) if merge == 'batch' else DOTGraph(bidir)
+        self._filter = config.node_filter(filter)
+        self._pending = []
+        self._cleaned = None
+        self._driver = None
+
+    def add_file(self, fname):
+        """
+        Reads a dot file. The file is only merged by merge().
+        """
+        with open(fname, 'r', encoding='ascii') as f:
+            self.add_text(f.read())
+
+    def add_text(self, text):
+        """
+        Reads the text of a dot file, like add_file().
+        """
+        statements = DOTScanner.scan(text)
+        if statements is None:
+            if self._driver is None:
+                from DOTDriver import DOTDriver
+                self._driver = DOTDriver()
+            with _antlr_lock:
+                statements = self._driver.statements(text)
+        self.add_statements(statements)
+
+    def add_statements(self, statements):
+        """
+        Reads statements as returned by DOTScanner.scan().
+        """
+        reader = DOTReader(self.config.settings, self.params,
+                node_filter=self._filter, packages=self.config.packages)
+        DOTScanner.feed(statements, reader)
+        self._pending.append((reader.nodes, reader.file_edges,
+            reader.ignored_nodes))
+
+    def merge(self):
+        """
+        Merges the files read since the last call into the combined graph,
+        in the order they were read. Returns the DOTGraph.
+        """
+        if self._pending:
+            self._cleaned = None
+        for nodes, edges, ignored in self._pending:
+            self.graph.add_file(nodes, edges, ignored)
+        self._pending = []
+        return self.graph
+
+    def filter(self, focus=None, hops=1, direction='both', reduce=False):
+        """
+        Merges and cleans up the combined graph, optionally keeping only the
+        nodes within hops of the nodes matching the focus patterns and
+        removing the edges implied by longer paths. Returns the nodes,
+        EdgeIndex and edges that write() writes.
+        """
+        graph = self.merge()
+        edges, index = filter_edges(graph, self._filter.show_cleaned)
+        nodes = clean_nodes(graph.nodes, index)
+        if focus:
+            nodes, index, edges, found = focus_graph(nodes, index, edges,
+                    focus, hops, direction)
+            if not found:
+                logging.warning('No nodes match %s', focus)
+        if reduce:
+            reduce_edges(edges, index)
+        self._cleaned = (nodes, index, edges)
+        return self._cleaned
+
+    def write(self, fp, format='dot', buffer_size=BUFFER_SIZE):
+        """
+        Writes the graph as cleaned up by the last filter() call, or by a
+        new one if files have been read since. npz needs a binary file.
+        """
+        if self._cleaned is None or self._pending:
+            self.filter()
+        nodes, index, edges = self._cleaned
+        params = dict(self.params, format=format)
+        if format == 'dot':
+            writer = DOTWriter(self.config.settings, params,
+                    self.config.packages)
+        else:
+            from DOTFormats import WRITERS
+            writer = WRITERS[format](self.config.settings, params,
+                    self.config.packages)
+        writer.write(fp, nodes, index, edges, buffer_size)
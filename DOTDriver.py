@@ -0,0 +1,224 @@
+"""
+Runs the ANTLR parser on the files DOTScanner does not read.
+
+One lexer and one parser are kept for the whole run, so the DFA caches built
+while parsing the first files make the later ones faster. Each file is first
+parsed in SLL mode, which is much cheaper than full LL prediction, with an
+error strategy that gives up at the first syntax error. No parse tree is
+built: DOTParseListener gets the rule events while the parser runs and turns
+them into the same node_stmt, edge_stmt, a_list and exit_graph calls that
+walking the tree with DOTStatementListener makes. The events are kept until
+the parse has succeeded.
+
+This module is only imported when a file needs ANTLR, so runs on Doxygen
+output never load the ANTLR runtime.
+
+If SLL parsing fails, or the file has something the listener can't handle in
+the order the tree walk would (a subgraph in an edge statement), the file is
+parsed again in LL mode with error recovery and the tree is walked, exactly
+like before. The lexer's errors are held back during the SLL attempt and the
+text is read again for the LL parse, so the errors are printed in the same
+order as before too.
+"""
+
+from antlr4 import CommonTokenStream, InputStream, ParseTreeWalker
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorListener import ConsoleErrorListener, ErrorListener
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+
+from DOTLexer import DOTLexer
+from DOTListener import DOTListener
+from DOTParser import DOTParser
+from DOTReader import StatementRecorder
+
+
+class DOTStatementListener(DOTListener):
+    """
+    Turns the events of walking a parse tree into node_stmt, edge_stmt,
+    a_list and exit_graph calls of target.
+    """
+
+    def __init__(self, target):
+        self._target = target
+
+    def enterNode_stmt(self, ctx:DOTParser.Node_stmtContext):
+        self._target.node_stmt(ctx.node_id().getText())
+
+    def enterEdge_stmt(self, ctx:DOTParser.Edge_stmtContext):
+        self._target.edge_stmt(ctx.node_id().getText(),
+                ctx.edgeRHS().getText()[2:])
+
+    def exitA_list(self, ctx:DOTParser.A_listContext):
+        self._target.a_list([x.getText() for x in ctx.r_id()],
+                [x.getText() for x in ctx.v_id()])
+
+    def exitGraph(self, ctx:DOTParser.GraphContext):
+        self._target.exit_graph()
+
+
+class DOTParseListener(DOTListener):
+    """
+    Parse listener that calls node_stmt, edge_stmt, a_list and exit_graph of
+    target while the parser runs, like DOTStatementListener does when the
+    tree is walked. Rule contexts have no children when no parse tree is
+    built, so the text of a rule is taken from its tokens. Sets failed if
+    the events would not come in the same order as from
+    DOTStatementListener.
+    """
+
+    def __init__(self, target, tokens):
+        self._target = target
+        self._tokens = tokens
+        self._edge_depth = 0
+        self._edge_node = None
+        self._keys = []
+        self._values = []
+        self.failed = False
+
+    def _text(self, ctx):
+        if ctx.stop is None or ctx.stop.tokenIndex < ctx.start.tokenIndex:
+            return ''
+        return ''.join([t.text for t in
+            self._tokens[ctx.start.tokenIndex:ctx.stop.tokenIndex + 1]])
+
+    def exitNode_id(self, ctx:DOTParser.Node_idContext):
+        if isinstance(ctx.parentCtx, DOTParser.Node_stmtContext):
+            self._target.node_stmt(self._text(ctx))
+        elif (isinstance(ctx.parentCtx, DOTParser.Edge_stmtContext) and
+                self._edge_node is None):
+            self._edge_node = self._text(ctx)
+
+    def enterEdge_stmt(self, ctx:DOTParser.Edge_stmtContext):
+        self._edge_depth += 1
+        self._edge_node = None
+
+    def exitEdge_stmt(self, ctx:DOTParser.Edge_stmtContext):
+        self._edge_depth -= 1
+
+    def exitEdgeRHS(self, ctx:DOTParser.EdgeRHSContext):
+        if self._edge_node is None:
+            # The edge starts with a subgraph
+            self.failed = True
+            return
+        self._target.edge_stmt(self._edge_node, self._text(ctx)[2:])
+
+    def enterSubgraph(self, ctx:DOTParser.SubgraphContext):
+        # The tree walk would report the statements of the subgraph after
+        # the edge statement, but here they would come first.
+        if self._edge_depth > 0:
+            self.failed = True
+
+    def enterA_list(self, ctx:DOTParser.A_listContext):
+        self._keys = []
+        self._values = []
+
+    def exitR_id(self, ctx:DOTParser.R_idContext):
+        if isinstance(ctx.parentCtx, DOTParser.A_listContext):
+            self._keys.append(self._text(ctx))
+
+    def exitV_id(self, ctx:DOTParser.V_idContext):
+        self._values.append(self._text(ctx))
+
+    def exitA_list(self, ctx:DOTParser.A_listContext):
+        self._target.a_list(self._keys, self._values)
+
+    def exitGraph(self, ctx:DOTParser.GraphContext):
+        self._target.exit_graph()
+
+
+class LexerErrors(ErrorListener):
+    """
+    Keeps the errors of the lexer to print them later like
+    ConsoleErrorListener does.
+    """
+
+    def __init__(self):
+        self.errors = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.errors.append((recognizer, offendingSymbol, line, column, msg, e))
+
+    def print(self):
+        for error in self.errors:
+            ConsoleErrorListener.INSTANCE.syntaxError(*error)
+
+
+class DOTDriver:
+    """
+    Parses dot files with ANTLR into the statements DOTScanner.scan()
+    returns.
+    """
+
+    def __init__(self):
+        self._lexer = DOTLexer(None)
+        self._parser = DOTParser(None)
+        self.sll_files = 0
+        self.ll_files = 0
+
+    def read(self, fname):
+        """
+        Returns the statements of a file. The file is read like
+        antlr4.FileStream reads it.
+        """
+        with open(fname, 'rb') as f:
+            return self.statements(f.read().decode('ascii'))
+
+    def statements(self, text):
+        """
+        Returns the statements of the dot file in text.
+        """
+        lexer_errors = LexerErrors()
+        self._lexer.removeErrorListeners()
+        self._lexer.addErrorListener(lexer_errors)
+        self._lexer.inputStream = InputStream(text)
+        statements = self._parse_sll(CommonTokenStream(self._lexer))
+        if statements is not None:
+            self.sll_files += 1
+            lexer_errors.print()
+            return statements
+        self.ll_files += 1
+        # Read the tokens again, so that the errors of the lexer come in
+        # between those of the parser.
+        self._lexer.removeErrorListeners()
+        self._lexer.addErrorListener(ConsoleErrorListener.INSTANCE)
+        self._lexer.inputStream = InputStream(text)
+        return self._parse_ll(CommonTokenStream(self._lexer))
+
+    def _parse_sll(self, stream):
+        """
+        Returns the statements or None if the fast parse failed.
+        """
+        parser = self._parser
+        stream.seek(0)
+        parser.setTokenStream(stream)
+        parser.buildParseTrees = False
+        parser._errHandler = BailErrorStrategy()
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser.removeErrorListeners()
+        recorder = StatementRecorder()
+        listener = DOTParseListener(recorder, stream.tokens)
+        parser.addParseListener(listener)
+        try:
+            parser.graph()
+        except ParseCancellationException:
+            return None
+        finally:
+            parser.removeParseListeners()
+        if listener.failed:
+            return None
+        return recorder.statements
+
+    def _parse_ll(self, stream):
+        parser = self._parser
+        stream.seek(0)
+        parser.setTokenStream(stream)
+        parser.buildParseTrees = True
+        parser._errHandler = DefaultErrorStrategy()
+        parser._interp.predictionMode = PredictionMode.LL
+        parser.removeErrorListeners()
+        parser.addErrorListener(ConsoleErrorListener.INSTANCE)
+        tree = parser.graph()
+        recorder = StatementRecorder()
+        ParseTreeWalker.DEFAULT.walk(DOTStatementListener(recorder), tree)
+        return recorder.statements
@@ -0,0 +1,155 @@
+"""
+Node filtering with FILTERED_RE_NODES, FILTERED_EXACT_NODES and FILTER_IGNORE.
+"""
+
+import logging
+import re
+
+
+def _combine(patterns):
+    """
+    Combines regular expressions into a single alternation where group n+1
+    is pattern n. Returns None if that can't be done because a pattern has
+    groups of its own (which would renumber back references) or doesn't
+    compile as part of an alternation (e.g. it sets global flags).
+    """
+    if len(patterns) == 0:
+        return re.compile('(?!)')
+    if len([p for p in patterns if p.groups > 0]) > 0:
+        return None
+    try:
+        return re.compile('|'.join(['({})'.format(p.pattern) for p in patterns]),
+                re.MULTILINE)
+    except re.error:
+        return None
+
+
+class DOTFilter:
+    """
+    Decides which nodes are shown. Built once per run from the settings: the
+    regular expressions are combined into one alternation, exact names are
+    kept in a set and the verdict for each label is memoized, so filtering
+    costs the same no matter how many times a label appears.
+
+    show_node() is used when reading the files and show_cleaned() when the
+    combined graph is cleaned up before printing.
+    """
+
+    def __init__(self, settings, enabled=True):
+        self.enabled = enabled
+        self._re_nodes = [re.compile(x, re.MULTILINE) for x in settings['FILTERED_RE_NODES']]
+        self._ignore_list = [re.compile(x, re.MULTILINE) for x in settings['FILTER_IGNORE']]
+        self._re_combined = _combine(self._re_nodes)
+        self._ignore_combined = _combine(self._ignore_list)
+        self._exact_nodes = set(settings['FILTERED_EXACT_NODES'])
+        # When the graph is cleaned up, FILTERED_RE_NODES are matched as
+        # plain substrings of the label.
+        self._texts = [str(x) for x in settings['FILTERED_RE_NODES']]
+        self._text_re = re.compile('|'.join(
+            [re.escape(x) for x in self._texts]) or '(?!)')
+        self._shown = {}
+        self._cleaned = {}
+
+    def _first_match(self, patterns, combined, label):
+        """
+        Returns the index of the first pattern that matches label or -1.
+        """
+        if combined is not None:
+            m = combined.match(label)
+            if m:
+                return m.lastindex - 1
+            return -1
+        for i, p in enumerate(patterns):
+            if p.match(label):
+                return i
+        return -1
+
+    def show_node(self, node_label):
+        """
+        Checks whether given node should be shown in the graph. Nodes are
+        filtered with FILTERED_RE_NODES (regular expression matching) and
+        FILTERED_EXACT_NODES (exact string match) unless they match
+        FILTER_IGNORE.
+        """
+        if not self.enabled:
+            return True
+        verdict = self._shown.get(node_label)
+        if verdict is None:
+            verdict = self._show_node(node_label)
+            self._shown[node_label] = verdict
+        return verdict
+
+    def _show_node(self, node_label):
+        if self._first_match(self._ignore_list, self._ignore_combined,
+                node_label) != -1:
+            logging.info('Allowing %s', node_label)
+            return True
+        if self._first_match(self._re_nodes, self._re_combined,
+                node_label) != -1:
+            logging.debug('Ignoring node %s', node_label)
+            return False
+        if node_label.replace('"', '') in self._exact_nodes:
+            logging.debug('Ignoring node %s', node_label)
+            return False
+        return True
+
+    def show_cleaned(self, node_label):
+        """
+        Checks whether given node should be shown when cleaning up the
+        combined graph. Nodes containing the text of any FILTERED_RE_NODES
+        entry or matching FILTERED_EXACT_NODES exactly are not shown.
+        """
+        if not self.enabled:
+            return True
+        verdict = self._cleaned.get(node_label)
+        if verdict is None:
+            verdict = not (self._text_re.search(node_label) or
+                    node_label.replace('"', '') in self._exact_nodes)
+            self._cleaned[node_label] = verdict
+        return verdict
+
+    def read_pattern(self, node_label):
+        """
+        Returns the FILTERED_RE_NODES or FILTERED_EXACT_NODES entry that made
+        show_node() reject the label, or None.
+        """
+        if self._first_match(self._ignore_list, self._ignore_combined,
+                node_label) != -1:
+            return None
+        i = self._first_match(self._re_nodes, self._re_combined, node_label)
+        if i != -1:
+            return self._re_nodes[i].pattern
+        if node_label.replace('"', '') in self._exact_nodes:
+            return node_label.replace('"', '')
+        return None
+
+    def cleaned_pattern(self, node_label):
+        """
+        Returns the FILTERED_RE_NODES or FILTERED_EXACT_NODES entry that made
+        show_cleaned() reject the label, or None.
+        """
+        for text in self._texts:
+            if text in node_label:
+                return text
+        if node_label.replace('"', '') in self._exact_nodes:
+            return node_label.replace('"', '')
+        return None
+
+    def cleaned_labels(self):
+        """
+        Returns the labels show_cleaned() has rejected so far.
+        """
+        return [label for label, verdict in self._cleaned.items() if not verdict]
+
+    def count_hits(self, labels, pattern_func):
+        """
+        Counts the labels rejected by each filter entry. pattern_func is
+        read_pattern or cleaned_pattern. Only used for statistics, so the
+        filters themselves don't have to keep count.
+        """
+        hits = {}
+        for label in labels:
+            pattern = pattern_func(label)
+            if pattern is not None:
+                hits[pattern] = hits.get(pattern, 0) + 1
+        return hits
@@ -0,0 +1,229 @@
+"""
+Machine-readable output formats for --format: a JSON edge list, GraphML and
+a NumPy .npz bundle.
+
+The writers have the interface of DOTWriter and write the same nodes and
+edges in the same order, so they work with DOTGraph and with StreamingGraph.
+Labels and attribute values are written without the quotes of the dot
+language. Clusters, the legend and the dot header and footer are only
+written to dot files.
+
+The .npz bundle is written uncompressed, so load_npz() can memory-map its
+arrays instead of reading them. It holds:
+
+    strings_data, strings_offsets   String table: string i is the UTF-8 text
+                                    strings_data[strings_offsets[i]:
+                                    strings_offsets[i + 1]]. Strings 0 to
+                                    n - 1 are the node labels.
+    attrsets_indptr, attrsets_keys, attrsets_values
+                                    Attribute sets as a CSR matrix: set i
+                                    has the key and value string ids at
+                                    attrsets_indptr[i]:attrsets_indptr[i + 1].
+    node_attrs                      Attribute set of each node.
+    indptr, indices                 Edges as a CSR matrix: the edges of node
+                                    i go to the nodes indices[indptr[i]:
+                                    indptr[i + 1]].
+    edge_attrs                      Attribute set of each edge, in the order
+                                    of indices.
+"""
+
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+from DOTWriter import DOTWriter, batches
+
+def unquote(text):
+    """
+    Returns a dot ID without its quotes.
+    """
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1].replace('\\"', '"')
+    return text
+
+
+def _unquote_attrs(attrs):
+    return {k: unquote(v) for k, v in sorted(attrs.items())}
+
+
+class JSONWriter(DOTWriter):
+    """
+    Writes {"name": ..., "nodes": [{"id": ..., "attrs": {...}}, ...],
+    "edges": [{"source": ..., "target": ..., "attrs": {...}}, ...]}.
+    """
+
+    def lines(self, sorted_nodes, index, sorted_edges):
+        yield '{{"name": {},\n"nodes": ['.format(json.dumps(self._params['header']))
+        sep = '\n'
+        for batch in batches(sorted_nodes):
+            items = [json.dumps({'id': unquote(key), 'attrs': _unquote_attrs(node)})
+                    for key, node in batch
+                    if index is None or index.has_edges(key)]
+            if items:
+                yield sep + ',\n'.join(items)
+                sep = ',\n'
+        yield '\n],\n"edges": ['
+        sep = '\n'
+        for batch in batches(sorted_edges):
+            yield sep + ',\n'.join([json.dumps({'source': unquote(k[0]),
+                'target': unquote(k[1]), 'attrs': _unquote_attrs(v)})
+                for k, v in batch])
+            sep = ',\n'
+        yield '\n]}\n'
+
+
+class GraphMLWriter(DOTWriter):
+    """
+    Writes GraphML with a string key for every node and edge attribute. The
+    keys have to be declared before the graph, so the nodes and edges are
+    read into lists first.
+    """
+
+    def lines(self, sorted_nodes, index, sorted_edges):
+        nodes = [(key, node) for key, node in sorted_nodes
+                if index is None or index.has_edges(key)]
+        edges = list(sorted_edges)
+        node_keys = sorted(set(k for key, node in nodes for k in node))
+        edge_keys = sorted(set(k for key, edge in edges for k in edge))
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for prefix, domain, keys in (('n', 'node', node_keys),
+                ('e', 'edge', edge_keys)):
+            for k in keys:
+                yield '  <key id={} for="{}" attr.name={} attr.type="string"/>\n' \
+                        .format(quoteattr(prefix + '_' + k), domain, quoteattr(k))
+        yield '  <graph id={} edgedefault="directed">\n'.format(
+                quoteattr(self._params['header'] or 'G'))
+        for batch in batches(nodes):
+            yield ''.join(['    <node id={}>\n{}    </node>\n'.format(
+                quoteattr(unquote(key)), self._data('n', node))
+                for key, node in batch])
+        for batch in batches(edges):
+            yield ''.join(['    <edge source={} target={}>\n{}    </edge>\n'.format(
+                quoteattr(unquote(k[0])), quoteattr(unquote(k[1])),
+                self._data('e', v)) for k, v in batch])
+        yield '  </graph>\n</graphml>\n'
+
+    def _data(self, prefix, attrs):
+        return ''.join(['      <data key={}>{}</data>\n'.format(
+            quoteattr(prefix + '_' + k), escape(unquote(v)))
+            for k, v in sorted(attrs.items())])
+
+
+class NpzWriter(DOTWriter):
+    """
+    Writes the .npz bundle described above. Needs numpy and a binary output
+    file.
+    """
+
+    def write_sorted(self, f, sorted_nodes, index, sorted_edges,
+            buffer_size=None):
+        import numpy as np
+        strings = []
+        string_ids = {}
+        def intern(text):
+            i = string_ids.get(text)
+            if i is None:
+                i = len(strings)
+                string_ids[text] = i
+                strings.append(text)
+            return i
+        attr_sets = {}
+        attrsets_indptr = [0]
+        attrsets_keys = []
+        attrsets_values = []
+        def intern_attrs(attrs):
+            key = tuple(sorted(attrs.items()))
+            i = attr_sets.get(key)
+            if i is None:
+                i = len(attr_sets)
+                attr_sets[key] = i
+                for k, v in key:
+                    attrsets_keys.append(intern(k))
+                    attrsets_values.append(intern(unquote(v)))
+                attrsets_indptr.append(len(attrsets_keys))
+            return i
+
+        # Node labels first, so that node i is string i
+        node_ids = {}
+        node_attrs = []
+        for key, node in sorted_nodes:
+            if index is None or index.has_edges(key):
+                node_ids[key] = len(strings)
+                string_ids.setdefault(unquote(key), len(strings))
+                strings.append(unquote(key))
+                node_attrs.append(node)
+        n = len(node_attrs)
+        node_attrs = [intern_attrs(node) for node in node_attrs]
+        sources = []
+        targets = []
+        edge_attrs = []
+        for k, v in sorted_edges:
+            sources.append(node_ids[k[0]])
+            targets.append(node_ids[k[1]])
+            edge_attrs.append(intern_attrs(v))
+
+        # Group the edges by source, keeping their output order
+        sources = np.array(sources, dtype=np.int32)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+
+        data = [s.encode('utf-8') for s in strings]
+        strings_offsets = np.zeros(len(data) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in data], out=strings_offsets[1:])
+        np.savez(f,
+                strings_data=np.frombuffer(b''.join(data), dtype=np.uint8),
+                strings_offsets=strings_offsets,
+                attrsets_indptr=np.array(attrsets_indptr, dtype=np.int64),
+                attrsets_keys=np.array(attrsets_keys, dtype=np.int32),
+                attrsets_values=np.array(attrsets_values, dtype=np.int32),
+                node_attrs=np.array(node_attrs, dtype=np.int32),
+                indptr=indptr,
+                indices=np.array(targets, dtype=np.int32)[order],
+                edge_attrs=np.array(edge_attrs, dtype=np.int32)[order])
+        f.flush()
+
+
+# Writer of each --format other than dot
+WRITERS = {
+    'json': JSONWriter,
+    'graphml': GraphMLWriter,
+    'npz': NpzWriter,
+}
+
+
+def load_npz(fname, mmap=True):
+    """
+    Returns the arrays of a bundle written by NpzWriter as a dict. With mmap
+    the arrays are memory-mapped from the file, which np.load() can't do for
+    .npz files.
+    """
+    import numpy as np
+    import zipfile
+    if not mmap:
+        with np.load(fname) as bundle:
+            return dict(bundle)
+    arrays = {}
+    with zipfile.ZipFile(fname) as z, open(fname, 'rb') as f:
+        for info in z.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('{} is compressed'.format(info.filename))
+            # Skip the local file header, whose extra field can differ from
+            # the one in the central directory
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+            if np.lib.format.read_magic(f) == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran_order, dtype = header
+            name = info.filename[:-4] if info.filename.endswith('.npy') \
+                    else info.filename
+            if shape == (0,):
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(fname, dtype=dtype, mode='r',
+                        offset=f.tell(), shape=shape,
+                        order='F' if fortran_order else 'C')
+    return arrays
@@ -0,0 +1,601 @@
+"""
+Data structures for the combined graph.
+"""
+
+import itertools
+import logging
+import os
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+from operator import itemgetter
+
+from DOTWriter import edge_sort_key
+
+# Number of edges StreamingGraph keeps in memory before moving them to disk.
+SPILL_EDGES = 1000000
+# Number of new edge rows BatchGraph collects before merging them.
+BATCH_EDGES = 1000000
+
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+class EdgeIndex:
+    """
+    Adjacency index of a graph's edges keyed by node label. Keeps the
+    successors and predecessors of every node so that degree and neighbour
+    lookups don't need to scan all edges.
+    """
+
+    def __init__(self, edges=()):
+        self.succ = {}
+        self.pred = {}
+        for n1, n2 in edges:
+            self.add(n1, n2)
+
+    def add(self, n1, n2):
+        """
+        Adds edge n1 -> n2. Adding an existing edge does nothing.
+        """
+        if n1 in self.succ:
+            self.succ[n1].add(n2)
+        else:
+            self.succ[n1] = {n2}
+        if n2 in self.pred:
+            self.pred[n2].add(n1)
+        else:
+            self.pred[n2] = {n1}
+
+    def remove(self, n1, n2):
+        """
+        Removes edge n1 -> n2 if it exists.
+        """
+        if n2 in self.succ.get(n1, ()):
+            self.succ[n1].discard(n2)
+            if not self.succ[n1]:
+                del self.succ[n1]
+            self.pred[n2].discard(n1)
+            if not self.pred[n2]:
+                del self.pred[n2]
+
+    def has_edges(self, label):
+        """
+        Checks if given node has any edges.
+        """
+        return label in self.succ or label in self.pred
+
+    def degree(self, label):
+        """
+        Number of edges going in or out of the node.
+        """
+        return len(self.succ.get(label, ())) + len(self.pred.get(label, ()))
+
+    def neighbourhood(self, labels, hops, direction='both'):
+        """
+        Returns the nodes at most hops edges away from the given nodes,
+        following edges forwards ('out'), backwards ('in') or both ways. A
+        negative hops means no limit.
+        """
+        adjacency = []
+        if direction in ('out', 'both'):
+            adjacency.append(self.succ)
+        if direction in ('in', 'both'):
+            adjacency.append(self.pred)
+        seen = set(labels)
+        frontier = list(seen)
+        while frontier and hops != 0:
+            next_frontier = []
+            for label in frontier:
+                for adj in adjacency:
+                    for n in adj.get(label, ()):
+                        if not n in seen:
+                            seen.add(n)
+                            next_frontier.append(n)
+            frontier = next_frontier
+            hops -= 1
+        return seen
+
+    def __contains__(self, edge):
+        return edge[1] in self.succ.get(edge[0], ())
+
+
+class DOTGraph:
+    """
+    The combined graph. DOTReader writes the nodes and edges of each file
+    directly into it, so merging is linear in the size of the input and only
+    one copy of the graph is kept.
+    """
+
+    def __init__(self, bidir=False):
+        self.bidir = bidir
+        self.nodes = {}
+        self.edges = {}
+        self.index = EdgeIndex() # Adjacency of self.edges
+        self.ignored_nodes = {}
+        # Nodes and edges with equal attributes share them, so the stored
+        # attributes must not be modified.
+        self.attr_sets = AttrSets()
+
+    def has_node(self, label):
+        return label in self.nodes
+
+    def add_node(self, label, attrs):
+        """
+        Adds a node. The first file that defines a label decides its
+        attributes.
+        """
+        if not label in self.nodes:
+            self.nodes[label] = self.attr_sets.node(label, attrs)
+
+    def ignore(self, label):
+        """
+        Records a node that was filtered out.
+        """
+        self.ignored_nodes[label] = label
+
+    def add_edges(self, new_edges):
+        """
+        Merges the edges of one file into the graph. Self-referential edges
+        are dropped and, with bidir, an edge going the other way is turned
+        into a bidirectional one.
+        """
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        for key, edge in new_edges.items():
+            is_unique = not (key[1], key[0]) in self.edges
+            if key[0] != key[1]: # No self-referential edges
+                if is_unique: # There is no edge going the other way
+                    if debug:
+                        logging.debug('Adding new unique edge %s', key)
+                    self.edges[key] = self.attr_sets.shared(edge)
+                    self.index.add(*key)
+                else:
+                    if self.bidir:
+                        if debug:
+                            logging.debug('Altering existing edge %s', key)
+                        reverse = (key[1], key[0])
+                        self.edges[reverse] = self.attr_sets.shared(
+                                dict(self.edges[reverse], dir="both"))
+                    else:
+                        if debug:
+                            logging.debug('Adding new non-unique edge %s', key)
+                        self.edges[key] = self.attr_sets.shared(edge)
+                        self.index.add(*key)
+            elif debug:
+                logging.debug('Removed self-referential link %s', key)
+
+    def add_file(self, nodes, edges, ignored_nodes):
+        """
+        Merges the result of a file read into another graph (e.g. in a worker
+        process). Files must be added in the same order as they would have
+        been read.
+        """
+        for label, attrs in nodes.items():
+            self.add_node(label, attrs)
+        self.add_edges(edges)
+        self.ignored_nodes.update(ignored_nodes)
+
+
+def consolidate(src, dst, attrs, bidir=False):
+    """
+    Merges rows of edges, given as NumPy arrays of label and attribute set
+    ids in file order, with the rules of DOTGraph.add_edges(): self loops are
+    dropped, the last row of an edge decides its attributes and, with bidir,
+    a row going the other way after it makes the edge bidirectional.
+    Returns the src, dst and attrs arrays of the merged edges in the order
+    they were first seen, and a bool array of the bidirectional ones.
+    """
+    import numpy as np
+    keep = src != dst
+    src = src[keep]
+    dst = dst[keep]
+    attrs = attrs[keep]
+    if len(src) == 0:
+        return src, dst, attrs, np.zeros(0, dtype=bool)
+    if bidir:
+        pairs = np.minimum(src, dst).astype(np.int64) << 32 | np.maximum(src, dst)
+    else:
+        pairs = src.astype(np.int64) << 32 | dst
+    # Rows of the same edge (or pair of nodes with bidir) next to each
+    # other, in file order
+    rows = np.argsort(pairs, kind='stable')
+    pairs = pairs[rows]
+    starts = np.flatnonzero(np.concatenate(([True], pairs[1:] != pairs[:-1])))
+    del pairs
+    first = rows[starts]
+    groups = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(rows))))
+    # The first row of a pair decides the direction of the edge
+    forward = src[rows] == src[first][groups]
+    del groups
+    last = np.maximum.reduceat(np.where(forward, rows, -1), starts)
+    if bidir:
+        both = np.maximum.reduceat(np.where(forward, -1, rows), starts) > last
+    else:
+        both = np.zeros(len(starts), dtype=bool)
+    order = np.argsort(first)
+    first = first[order]
+    return src[first], dst[first], attrs[last[order]], both[order]
+
+
+class NodeAttrs(Mapping):
+    """
+    Read-only attributes of a node: the node's label and a shared attribute
+    set with the rest of them. Compares equal to the dict of the same
+    attributes, with the label first.
+    """
+
+    __slots__ = ('label', 'base')
+
+    def __init__(self, label, base):
+        self.label = label
+        self.base = base
+
+    def __getitem__(self, key):
+        if key == 'label':
+            return self.label
+        return self.base[key]
+
+    def __contains__(self, key):
+        return key == 'label' or key in self.base
+
+    def __iter__(self):
+        yield 'label'
+        yield from self.base
+
+    def __len__(self):
+        return len(self.base) + 1
+
+    def items(self):
+        return [('label', self.label)] + list(self.base.items())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        return (NodeAttrs, (self.label, self.base))
+
+
+class AttrSets:
+    """
+    Interned attribute sets. Equal attribute dicts are stored once and
+    referred to by an integer id. The stored dicts must not be modified.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self.sets = []
+
+    def intern(self, attrs):
+        key = tuple(attrs.items())
+        i = self._ids.get(key)
+        if i is None:
+            i = len(self.sets)
+            self._ids[key] = i
+            self.sets.append(dict(attrs))
+        return i
+
+    def shared(self, attrs):
+        """
+        Returns the stored dict equal to attrs.
+        """
+        return self.sets[self.intern(attrs)]
+
+    def node(self, label, attrs):
+        """
+        Returns the attributes of a node as NodeAttrs sharing everything but
+        the label, or as a shared dict if the label is not the first
+        attribute.
+        """
+        if isinstance(attrs, NodeAttrs):
+            return NodeAttrs(label, self.shared(attrs.base)) \
+                    if attrs.label == label else self.shared(attrs)
+        if next(iter(attrs), None) != 'label' or attrs['label'] != label:
+            return self.shared(attrs)
+        return NodeAttrs(label, self.shared(
+            {k: v for k, v in attrs.items() if k != 'label'}))
+
+
+class BatchGraph(DOTGraph):
+    """
+    Combined graph for --merge batch. Same interface and merge rules as
+    DOTGraph, but the edges of the files are collected as rows of label and
+    attribute set ids and merged with consolidate() in one pass when the
+    edges are used, or when more than batch_edges new rows (and at least as
+    many as there are merged edges) have been collected. Needs numpy.
+    """
+
+    def __init__(self, bidir=False, batch_edges=BATCH_EDGES):
+        self.bidir = bidir
+        self.batch_edges = batch_edges
+        self.nodes = {}
+        self.ignored_nodes = {}
+        self.attr_sets = AttrSets() # Of the nodes
+        # Label -> id and edge attribute items -> id, numbered in the order
+        # they are first seen
+        self._label_ids = defaultdict()
+        self._label_ids.default_factory = self._label_ids.__len__
+        self._attr_ids = defaultdict()
+        self._attr_ids.default_factory = self._attr_ids.__len__
+        self._attrs = [] # Shared dict of each edge attribute id
+        self._merged = None # src, dst and attrs arrays of the merged edges
+        self._rows = (array('i'), array('i'), array('i')) # New rows
+        self._edges = None
+        self._index = None
+
+    def add_edges(self, new_edges):
+        src, dst, attrs = self._rows
+        label_id = self._label_ids.__getitem__
+        keys = new_edges.keys()
+        src.extend(map(label_id, map(itemgetter(0), keys)))
+        dst.extend(map(label_id, map(itemgetter(1), keys)))
+        attrs.extend(map(self._attr_ids.__getitem__,
+            map(tuple, map(dict.items, new_edges.values()))))
+        merged = 0 if self._merged is None else len(self._merged[0])
+        if len(src) >= max(self.batch_edges, merged):
+            self.consolidate()
+
+    def _attr_dicts(self):
+        self._attrs.extend([dict(items) for items in
+            itertools.islice(self._attr_ids, len(self._attrs), None)])
+        return self._attrs
+
+    def consolidate(self):
+        """
+        Merges the new rows into the merged edges.
+        """
+        import numpy as np
+        if len(self._rows[0]) == 0 and self._merged is not None:
+            return
+        rows = [np.frombuffer(a, dtype=np.int32) for a in self._rows]
+        if self._merged is not None:
+            rows = [np.concatenate((m, r)) for m, r in zip(self._merged, rows)]
+        src, dst, attrs, both = consolidate(*rows, bidir=self.bidir)
+        if both.any():
+            sets = self._attr_dicts()
+            ids = np.unique(attrs[both]).tolist()
+            both_ids = [self._attr_ids[tuple(dict(sets[i], dir="both").items())]
+                    for i in ids]
+            table = np.arange(len(self._attr_ids), dtype=np.int32)
+            table[ids] = both_ids
+            attrs = np.where(both, table[attrs], attrs)
+        self._merged = (src, dst, attrs)
+        self._rows = (array('i'), array('i'), array('i'))
+        self._edges = None
+        self._index = None
+
+    @property
+    def labels(self):
+        return list(self._label_ids)
+
+    @property
+    def edges(self):
+        if self._edges is None or len(self._rows[0]) > 0:
+            self.consolidate()
+            labels = self.labels
+            src, dst, attrs = [a.tolist() for a in self._merged]
+            self._edges = dict(zip(
+                zip(map(labels.__getitem__, src), map(labels.__getitem__, dst)),
+                map(self._attr_dicts().__getitem__, attrs)))
+        return self._edges
+
+    @property
+    def index(self):
+        if self._index is None or len(self._rows[0]) > 0:
+            self._index = EdgeIndex(self.edges)
+        return self._index
+
+
+class StreamingGraph:
+    """
+    Combined graph for --streaming. Same interface and merge rules as
+    DOTGraph, but labels are interned to integer ids, attribute sets are
+    shared between nodes and edges that have equal attributes and each edge
+    is a single integer in memory. When there are more than spill_edges
+    edges they are moved to a temporary SQLite database and the output is
+    produced by letting SQLite sort them, so memory use no longer grows with
+    the number of edges.
+    """
+
+    def __init__(self, bidir=False, spill_edges=SPILL_EDGES):
+        self.bidir = bidir
+        self.spill_edges = spill_edges
+        self.labels = [] # Label of each id
+        self._label_ids = {}
+        self.nodes = {} # Label id -> attribute set id, without the label
+        self.ignored_nodes = {}
+        self.attr_sets = AttrSets()
+        # Edge (id1 << 32 | id2) -> (insertion number << 32 | attribute set
+        # id) until the edges are spilled to self._db.
+        self._edges = {}
+        self._seq = 0
+        self._db = None
+        self._db_dir = None
+
+    def _label_id(self, label):
+        i = self._label_ids.get(label)
+        if i is None:
+            i = len(self.labels)
+            self._label_ids[label] = i
+            self.labels.append(label)
+        return i
+
+    def has_node(self, label):
+        i = self._label_ids.get(label)
+        return i is not None and i in self.nodes
+
+    def add_node(self, label, attrs):
+        """
+        Adds a node. The first file that defines a label decides its
+        attributes. The label attribute is the same as the node's label, so
+        it is left out of the attribute set.
+        """
+        i = self._label_id(label)
+        if not i in self.nodes:
+            self.nodes[i] = self.attr_sets.intern(
+                    {k: v for k, v in attrs.items() if k != 'label'})
+
+    def ignore(self, label):
+        self.ignored_nodes[label] = label
+
+    def add_edges(self, new_edges):
+        """
+        Merges the edges of one file with the same rules as
+        DOTGraph.add_edges().
+        """
+        for key, edge in new_edges.items():
+            if key[0] == key[1]:
+                continue
+            n1 = self._label_id(key[0])
+            n2 = self._label_id(key[1])
+            reverse = self._get_edge(n2 << _ID_BITS | n1)
+            if reverse is None:
+                self._put_edge(n1 << _ID_BITS | n2, self.attr_sets.intern(edge))
+            elif self.bidir:
+                attrs = dict(self.attr_sets.sets[reverse & _ID_MASK])
+                attrs['dir'] = "both"
+                self._put_edge(n2 << _ID_BITS | n1, self.attr_sets.intern(attrs))
+            else:
+                self._put_edge(n1 << _ID_BITS | n2, self.attr_sets.intern(edge))
+
+    def add_file(self, nodes, edges, ignored_nodes):
+        for label, attrs in nodes.items():
+            self.add_node(label, attrs)
+        self.add_edges(edges)
+        self.ignored_nodes.update(ignored_nodes)
+
+    def _get_edge(self, key):
+        """
+        Returns insertion number << 32 | attribute set id of an edge or None.
+        """
+        if self._db is None:
+            return self._edges.get(key)
+        row = self._db.execute('SELECT seq, attrs FROM edges WHERE key=?',
+                (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0] << _ID_BITS | row[1]
+
+    def _put_edge(self, key, attrs):
+        """
+        Adds an edge or replaces the attributes of an existing one. An
+        existing edge keeps its place in the output order.
+        """
+        if self._db is None:
+            old = self._edges.get(key)
+            if old is None:
+                self._edges[key] = self._seq << _ID_BITS | attrs
+                self._seq += 1
+                if len(self._edges) > self.spill_edges:
+                    self._spill()
+            else:
+                self._edges[key] = old & ~_ID_MASK | attrs
+            return
+        if self._db.execute('UPDATE edges SET attrs=? WHERE key=?',
+                (attrs, key)).rowcount == 0:
+            self._db.execute('INSERT INTO edges VALUES (?, ?, ?)',
+                    (key, self._seq, attrs))
+            self._seq += 1
+
+    def _spill(self):
+        import sqlite3
+        import tempfile
+        logging.info('Moving %s edges to disk', len(self._edges))
+        self._db_dir = tempfile.mkdtemp(prefix='dotcomb')
+        self._db = sqlite3.connect(os.path.join(self._db_dir, 'edges.sqlite'))
+        self._db.execute('PRAGMA journal_mode=OFF')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute('CREATE TABLE edges (key INTEGER PRIMARY KEY, '
+                'seq INTEGER, attrs INTEGER)')
+        self._db.executemany('INSERT INTO edges VALUES (?, ?, ?)',
+                ((key, value >> _ID_BITS, value & _ID_MASK)
+                    for key, value in self._edges.items()))
+        self._edges = {}
+        labels = self.labels
+        self._db.create_function('sort_key', 1, lambda key: edge_sort_key(
+            (labels[key >> _ID_BITS], labels[key & _ID_MASK])),
+            deterministic=True)
+
+    def _all_edges(self):
+        """
+        Yields (key, attribute set id) of all edges in any order.
+        """
+        if self._db is None:
+            for key, value in self._edges.items():
+                yield key, value & _ID_MASK
+        else:
+            yield from self._db.execute('SELECT key, attrs FROM edges')
+
+    def _sorted_edges(self):
+        """
+        Yields (key, attribute set id) of all edges in output order.
+        """
+        labels = self.labels
+        if self._db is None:
+            edges = [(edge_sort_key((labels[key >> _ID_BITS], labels[key & _ID_MASK])),
+                value >> _ID_BITS, key, value & _ID_MASK)
+                for key, value in self._edges.items()]
+            edges.sort()
+            for _, _, key, attrs in edges:
+                yield key, attrs
+        else:
+            yield from self._db.execute(
+                    'SELECT key, attrs FROM edges ORDER BY sort_key(key), seq')
+
+    def cleanup(self, show_node):
+        """
+        Finds the edges whose both ends are nodes accepted by show_node and
+        the nodes that have such edges. Returns a function telling if an edge
+        key is kept, a bytearray telling if a node id is kept and the number
+        of kept edges.
+        """
+        labels = self.labels
+        shown = {}
+        def keep_node(i):
+            verdict = shown.get(i)
+            if verdict is None:
+                verdict = i in self.nodes and show_node(labels[i])
+                shown[i] = verdict
+            return verdict
+        def keep_edge(key):
+            return keep_node(key >> _ID_BITS) and keep_node(key & _ID_MASK)
+        has_edges = bytearray(len(labels))
+        count = 0
+        for key, attrs in self._all_edges():
+            if keep_edge(key):
+                has_edges[key >> _ID_BITS] = 1
+                has_edges[key & _ID_MASK] = 1
+                count += 1
+        return keep_edge, has_edges, count
+
+    def write(self, writer, f, show_node, buffer_size):
+        """
+        Cleans up the graph like main does for DOTGraph and writes it with
+        the DOTWriter in a single pass over the sorted edges. Returns the
+        number of nodes and edges written.
+        """
+        keep_edge, has_edges, count = self.cleanup(show_node)
+        labels = self.labels
+        sets = self.attr_sets.sets
+        logging.info('Nodes: %s, edges: %s', sum(has_edges), count)
+
+        node_ids = [(labels[i], i) for i in self.nodes if has_edges[i]]
+        node_ids.sort(key=writer.sort_func)
+        def node_items():
+            for label, i in node_ids:
+                yield label, NodeAttrs(label, sets[self.nodes[i]])
+        def edge_items():
+            for key, attrs in self._sorted_edges():
+                if keep_edge(key):
+                    yield (labels[key >> _ID_BITS], labels[key & _ID_MASK]), sets[attrs]
+        writer.write_sorted(f, node_items(), None, edge_items(), buffer_size)
+        return len(node_ids), count
+
+    def close(self):
+        """
+        Removes the temporary database.
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.remove(os.path.join(self._db_dir, 'edges.sqlite'))
+            os.rmdir(self._db_dir)
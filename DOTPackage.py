@@ -0,0 +1,32 @@
+"""
+Package (cluster) resolution with GROUP_RE_PATTERN.
+"""
+
+import functools
+import re
+
+# Number of labels whose package is remembered.
+CACHE_SIZE = 65536
+
+
+class PackageResolver:
+    """
+    Maps node labels to packages with GROUP_RE_PATTERN. The pattern is
+    compiled once and the package of each label is cached, as colouring,
+    grouping, clustering and sorting all ask for it.
+    """
+
+    def __init__(self, settings, cache_size=CACHE_SIZE):
+        self._pattern = re.compile(settings['GROUP_RE_PATTERN'])
+        self.pkg_name = functools.lru_cache(maxsize=cache_size)(self._pkg_name)
+
+    def _pkg_name(self, x):
+        """
+        Returns matching clustering value or empty string is string doesn't
+        match pattern.
+        """
+        p = self._pattern.findall(x)
+        if p:
+            return p[0]
+        else:
+            return ''
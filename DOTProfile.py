@@ -0,0 +1,122 @@
+"""
+Profiling for --profile DIR.
+
+DOTProfiler is attached to the DOTStats of a run and follows its stage
+timers: each stage gets its own cProfile profile, saved as DIR/<stage>.pstats,
+and a tracemalloc snapshot is saved as DIR/<stage>.tracemalloc when the
+stage ends for the last time. Stages done once per file (parse, extract,
+merge) are profiled over all files; their snapshot is taken when reading
+the files has finished. The parse time, size and node and edge counts of
+every file are recorded too, and DIR/report.txt lists the slowest and
+largest files with the top functions and allocations of each stage.
+
+With --jobs files are parsed in other processes, which are not profiled,
+but their per-file times are still recorded. Files are then discovered and
+looked up in the cache in a thread of the process pool; only the main thread
+is profiled, as only one profiler can be enabled at a time since Python 3.12.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+
+# Stages that are entered once per file
+FILE_STAGES = ['discover', 'cache', 'parse', 'extract', 'merge']
+
+
+class DOTProfiler:
+
+    def __init__(self, directory, top=20):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.top = top
+        self._profiles = {}
+        self._active = [] # Stack of stages being profiled
+        self._snapshots = []
+        self.files = [] # (parse seconds, size, nodes, edges, file name)
+        tracemalloc.start()
+
+    def enter(self, stage):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        if self._active:
+            self._profiles[self._active[-1]].disable()
+        profile = self._profiles.get(stage)
+        if profile is None:
+            profile = cProfile.Profile()
+            self._profiles[stage] = profile
+        self._active.append(stage)
+        profile.enable()
+
+    def exit(self, stage):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        self._profiles[stage].disable()
+        self._active.pop()
+        if self._active:
+            self._profiles[self._active[-1]].enable()
+        elif not stage in FILE_STAGES:
+            self._snapshot(stage)
+
+    def files_read(self):
+        """
+        Called when all files have been read. Takes the snapshot of the per
+        file stages.
+        """
+        self._snapshot('read')
+
+    def _snapshot(self, name):
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(os.path.join(self.directory, name + '.tracemalloc'))
+        self._snapshots.append((name, snapshot))
+
+    def add_file(self, fname, parse_time, nodes, edges):
+        try:
+            size = os.path.getsize(fname)
+        except OSError:
+            size = 0
+        self.files.append((parse_time, size, nodes, edges, fname))
+
+    def stop(self):
+        """
+        Stops tracing memory allocations.
+        """
+        tracemalloc.stop()
+
+    def close(self):
+        """
+        Saves the profiles and writes the report.
+        """
+        self.stop()
+        with open(os.path.join(self.directory, 'report.txt'), 'w') as f:
+            self._report_files(f, 'Slowest files', 0)
+            self._report_files(f, 'Largest files', 1)
+            for stage, profile in self._profiles.items():
+                profile.dump_stats(os.path.join(self.directory, stage + '.pstats'))
+                out = io.StringIO()
+                pstats.Stats(profile, stream=out).sort_stats('cumulative') \
+                        .print_stats(self.top)
+                f.write('\nStage {}\n{}'.format(stage, out.getvalue()))
+            previous = None
+            for name, snapshot in self._snapshots:
+                f.write('\nAllocations during {}\n'.format(name))
+                if previous is None:
+                    stats = snapshot.statistics('lineno')
+                else:
+                    stats = snapshot.compare_to(previous, 'lineno')
+                for stat in stats[:self.top]:
+                    f.write('{}\n'.format(stat))
+                previous = snapshot
+
+    def _report_files(self, f, title, column):
+        f.write('{}\n'.format(title))
+        f.write('{:>10} {:>10} {:>6} {:>6}  {}\n'.format('seconds', 'bytes',
+            'nodes', 'edges', 'file'))
+        for parse_time, size, nodes, edges, fname in sorted(self.files,
+                key=lambda x: x[column], reverse=True)[:self.top]:
+            f.write('{:10.4f} {:10} {:6} {:6}  {}\n'.format(parse_time, size,
+                nodes, edges, fname))
+        f.write('\n')
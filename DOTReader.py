@@ -1,52 +1,88 @@
-from antlr4 import *
-from DOTLexer import DOTLexer
-from DOTListener import DOTListener
-from DOTParser import DOTParser
-import sys
-import re
+from DOTFilter import DOTFilter
+from DOTPackage import PackageResolver
 import logging
-import pprint
-import re
 
-class DOTReader(DOTListener):
+class StatementRecorder:
+    """
+    Records node_stmt, edge_stmt and a_list calls in the format
+    DOTScanner.scan() returns, so that both parsers can be cached and
+    replayed the same way.
+    """
 
-    _settings = {}
-    _params = {}
-    _curr_node = ''
-    _curr_edge = ()
+    def __init__(self):
+        self.statements = []
 
-    nodes = {}
-    edges = {}
-    ignored_nodes = {}
-    _file_edges = {}
+    def node_stmt(self, node_id):
+        self.statements.append((node_id, None, None))
 
-    _patterns = []
-    _ignore_list = []
+    def edge_stmt(self, node1, node2):
+        self.statements.append((node1, node2, None))
+
+    def a_list(self, keys, values):
+        if self.statements and self.statements[-1][2] is None:
+            # Replaying the statement and then its attributes gives the same
+            # calls even if the attributes came from a later statement.
+            node1, node2, attrs = self.statements[-1]
+            self.statements[-1] = (node1, node2, (keys, values))
+        else:
+            self.statements.append((None, None, (keys, values)))
+
+    def exit_graph(self):
+        pass
 
-    _file_mappings = {} # Maps NodeXX with real labels. Files might have different node names for same labels.
 
-    def __init__(self, settings, params):
+class DOTReader:
+    """
+    Reads the nodes and edges of dot files from node_stmt, edge_stmt, a_list
+    and exit_graph calls, which come from DOTScanner.feed().
+    """
+
+    def __init__(self, settings, params, node_filter=None, packages=None):
+        """
+        The nodes, edges and ignored nodes of the last file read are kept in
+        nodes, file_edges and ignored_nodes for the caller to merge.
+        node_filter and packages are the DOTFilter and PackageResolver shared
+        by all files of the run. Everything else is per file state.
+        """
         self._settings = settings
         self._params = params
-        self._patterns = [re.compile(x, re.LOCALE|re.MULTILINE) for x in self._settings['FILTERED_RE_NODES']]
-        self._ignore_list = [re.compile(x, re.LOCALE|re.MULTILINE) for x in self._settings['FILTER_IGNORE']]
+        self._curr_node = ''
+        self._curr_edge = ()
 
-    def enterNode_stmt(self, ctx:DOTParser.Node_stmtContext):
-        node_text = ctx.node_id().getText()
-        self._curr_node = node_text
+        self.nodes = {} # Label nodes found in the last file
+        self.file_edges = {} # Label edges found in the last file, before merging.
+        self.ignored_nodes = {} # Nodes filtered out of the last file
+        self._nodes = {}
+        self._file_edges = {}
+        self._ignored_nodes = {}
+
+        self._file_mappings = {} # Maps NodeXX with real labels. Files might have different node names for same labels.
+
+        if node_filter is None:
+            node_filter = DOTFilter(settings, params['filter'] is True)
+        self._filter = node_filter
+        if packages is None:
+            packages = PackageResolver(settings)
+        self._packages = packages
+        self._debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    def node_stmt(self, node_id):
+        self._curr_node = node_id
         self._curr_edge = ()
 
-    def enterEdge_stmt(self, ctx:DOTParser.Edge_stmtContext):
+    def edge_stmt(self, node1, node2):
         ''' Get the nodes for this edge '''
-        self._curr_edge = (ctx.node_id().getText(),
-                ctx.edgeRHS().getText()[2:])
+        self._curr_edge = (node1, node2)
         self._curr_node = ''
 
-    def exitA_list(self, ctx:DOTParser.A_listContext):
+    def a_list(self, keys, values):
+        """
+        Attribute list of the current statement, as key and value token texts.
+        """
         if self._curr_node != '':
-            self._create_node(ctx)
+            self._create_node(keys, values)
         elif len(self._curr_edge) > 0:
-            self._create_edge(ctx)
+            self._create_edge(keys, values)
 
     def _node2label(self, x):
         if x in self._file_mappings:
@@ -57,10 +93,11 @@ class DOTReader(DOTListener):
     def inv_keys(self, l, x):
         return l[(x[1], x[0])]
 
-    def exitGraph(self, ctx:DOTParser.GraphContext):
-        logging.debug('Exiting graph')
+    def exit_graph(self):
+        if self._debug:
+            logging.debug('Exiting graph')
+            logging.debug('edges: %s', self._file_edges)
         new_edges = {}
-        logging.debug('edges: %s', self._file_edges)
         for key, edge in self._file_edges.items():
             # Remove edges that don't have nodes
             if key[0] in self._file_mappings and key[1] in self._file_mappings:
@@ -68,38 +105,28 @@ class DOTReader(DOTListener):
                 label2 = self._file_mappings[key[1]]
                 if self._show_node(label1) and self._show_node(label2):
                     new_edges[(label1, label2)] = edge
-            else:
-                logging.info('Removed %s -> %s', key[0], key[1])
-                logging.info('\t%s', self._file_mappings)
+            elif self._debug:
+                logging.debug('Removed %s -> %s', key[0], key[1])
+                logging.debug('\t%s', self._file_mappings)
         self._file_edges.clear()
         self._file_mappings.clear()
-        for key, edge in new_edges.items():
-            is_unique = not (key[1], key[0]) in self.edges
-            logging.debug('is_unique: %s %s', is_unique, key)
-            if key[0] != key[1]: # No self-referential edges
-                if is_unique: # There is no edge going the other way
-                    logging.info('Adding new unique edge %s', key)
-                    self.edges[key] = edge
-                else:
-                    if self._params['bidir']:
-                        logging.info('Altering existing edge %s', key)
-                        self.edges[(key[1], key[0])]['dir'] = "both"
-                    else:
-                        logging.info('Adding new non-unique edge %s', key)
-                        self.edges[key] = edge
-            else:
-                logging.debug('Removed self-referential link %s', key)
+        self._curr_node = ''
+        self._curr_edge = ()
+        self.nodes = self._nodes
+        self.file_edges = new_edges
+        self.ignored_nodes = self._ignored_nodes
+        self._nodes = {}
+        self._ignored_nodes = {}
 
     def next_file(self):
         logging.debug('Next file')
         self._curr_node = ''
         self._curr_edge = ()
 
-    def _create_node(self, ctx:DOTParser.A_listContext):
-        logging.debug('Node %s', self._curr_node)
-        attrs = {k: v for k,v in
-                dict(zip([x.getText() for x in ctx.r_id()],
-                         [x.getText() for x in ctx.v_id()])).items()
+    def _create_node(self, keys, values):
+        if self._debug:
+            logging.debug('Node %s', self._curr_node)
+        attrs = {k: v for k,v in dict(zip(keys, values)).items()
                 if not k in self._settings['FILTERED_FIELDS']}
         self._set_params(attrs)
         if self._params['level'] == 0:
@@ -110,32 +137,28 @@ class DOTReader(DOTListener):
                 # If there are more parts in the label that level, then the
                 # closing quotation mark disappears.
                 label = label + '"'
-        if not label in self.nodes and self._show_node(label):
+        if not label in self._nodes and self._show_node(label):
             attrs['label'] = label
-            self.nodes[label] = attrs
+            self._nodes[label] = attrs
         if not self._curr_node in self._file_mappings:
             self._file_mappings[self._curr_node] = label
 
-    def _create_edge(self, ctx:DOTParser.A_listContext):
-        logging.debug('Edge %s -> %s', self._curr_edge[0], self._curr_edge[1])
-        attrs = {k: v for k,v in
-                dict(zip([x.getText() for x in ctx.r_id()],
-                         [x.getText() for x in ctx.v_id()])).items()}
+    def _create_edge(self, keys, values):
+        if self._debug:
+            logging.debug('Edge %s -> %s', self._curr_edge[0], self._curr_edge[1])
+        attrs = dict(zip(keys, values))
         n1 = self._curr_edge[0]
         n2 = self._curr_edge[1]
         self._file_edges[(n1, n2)] = attrs
         #logging.debug('Edges: %s', self._file_edges)
 
-    def _edge_exists(self, node1, node2):
-        return ((node1, node2) in self.edges or (node2, node1) in self.edges)
-
     def _set_params(self, node):
         """
         Set some node parameters. This will set the color and group (if node fits
         into one).
         """
         found = False
-        pkg = self._pkg_name(node['label'])
+        pkg = self._packages.pkg_name(node['label'])
         if not self._settings['PACKAGE_COLORS'] is None:
             if pkg in self._settings['PACKAGE_COLORS']:
                 node['color'] = self._settings['PACKAGE_COLORS'][pkg]
@@ -146,7 +169,7 @@ class DOTReader(DOTListener):
                 found = True
         if found == False:
             node['color'] = self._settings['PACKAGE_COLORS']['other']
-        group = self._pkg_name(node['label'])
+        group = pkg
         if group != '':
             node['group'] = group.replace('.', '')
         if 'fillcolor' in node:
@@ -156,46 +179,10 @@ class DOTReader(DOTListener):
 
     def _show_node(self, node_label):
         """
-        Checks whether given node should be shown in the graph. Nodes are filtered
-        with FILTERED_RE_NODES (regular expression matching) and
-        FILTERED_EXACT_NODES (exact string match).
+        Checks whether given node should be shown in the graph and records
+        the nodes that are filtered out.
         """
-        if self._params['filter'] == True:
-            for p in self._ignore_list:
-                m = p.match(node_label)
-                if m:
-                    logging.info('Allowing %s', node_label)
-                    return True
-            for p in self._patterns:
-                m = p.match(node_label)
-                if m:
-                    logging.debug('Ignoring node %s', node_label)
-                    self.ignored_nodes[node_label] = node_label
-                    return False
-            if node_label.replace('"', '') in self._settings['FILTERED_EXACT_NODES']:
-                logging.debug('Ignoring node %s', node_label)
-                self.ignored_nodes[node_label] = node_label
-                return False
-            return True
-        else:
+        if self._filter.show_node(node_label):
             return True
-
-    def has_edges(self, node_label):
-        """
-        Checks if given node name has any edges. Nodes with no edges are not added
-        to the graph.
-        """
-        return len([
-            k for k in self._edges.keys() if k[0] == node_label or k[1] == node_label]) > 0
-
-    def _pkg_name(self, x):
-        """
-        Returns matching clustering value or empty string is string doesn't
-        match pattern.
-        """
-        p = re.findall(self._settings['GROUP_RE_PATTERN'], x)
-        if p:
-            return p[0]
-        else:
-            return ''
-
+        self._ignored_nodes[node_label] = node_label
+        return False
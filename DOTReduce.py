@@ -0,0 +1,125 @@
+"""
+Transitive reduction for --reduce transitive.
+
+An edge is redundant when its target can also be reached from its source
+along other edges. Cycles are handled by condensing the strongly connected
+components: edges inside a component are kept, and between components the
+edges of the transitive reduction of the condensed graph are kept. When
+several edges connect the same two components only the first one is kept,
+as the others are implied by it and the paths inside the components.
+
+Reachability is kept as a bitset per component in a Python int, built from
+the sinks up. The successors of each component are visited nearest first, so
+a successor that is already reachable through an earlier one is redundant.
+A bitset is dropped as soon as all predecessors of its component have been
+visited.
+
+Edges with dir=both (from --bidir) count in both directions.
+"""
+
+
+def _components(n, succ):
+    """
+    Returns the strongly connected component of each node, numbered in
+    topological order, and the number of components. Iterative version of
+    Tarjan's algorithm.
+    """
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    comp = [0] * n
+    count = 0
+    next_index = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = next_index
+        next_index += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i < len(succ[v]):
+                work[-1] = (v, i + 1)
+                w = succ[v][i]
+                if index[w] == -1:
+                    index[w] = low[w] = next_index
+                    next_index += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    comp[w] = count
+                    if w == v:
+                        break
+                count += 1
+    # Tarjan finds the components in reverse topological order
+    return [count - 1 - c for c in comp], count
+
+
+def redundant_edges(edges):
+    """
+    Returns the keys of the edges that the transitive reduction removes.
+    edges maps (node1, node2) to the attributes of the edge.
+    """
+    ids = {}
+    arcs = []
+    for key, attrs in edges.items():
+        a = ids.setdefault(key[0], len(ids))
+        b = ids.setdefault(key[1], len(ids))
+        arcs.append((key, a, b))
+        if attrs.get('dir') in ('both', '"both"'):
+            arcs.append((None, b, a))
+    n = len(ids)
+    succ = [[] for i in range(n)]
+    for key, a, b in arcs:
+        succ[a].append(b)
+    comp, count = _components(n, succ)
+    del succ
+
+    # Condensed graph. Parallel edges between two components are redundant.
+    redundant = []
+    cond = [[] for i in range(count)]
+    first = {}
+    preds = [0] * count
+    for key, a, b in arcs:
+        a = comp[a]
+        b = comp[b]
+        if key is None or a == b:
+            continue
+        if (a, b) in first:
+            redundant.append(key)
+        else:
+            first[(a, b)] = key
+            cond[a].append(b)
+            preds[b] += 1
+
+    # A component reaches only components after it in topological order, so
+    # counting bits from the end keeps the ints of the later ones small.
+    reach = [0] * count
+    for a in range(count - 1, -1, -1):
+        bits = 0
+        for b in sorted(cond[a]):
+            bit = 1 << (count - 1 - b)
+            if bits & bit:
+                redundant.append(first[(a, b)])
+            else:
+                bits |= reach[b] | bit
+            preds[b] -= 1
+            if preds[b] == 0:
+                reach[b] = None
+        reach[a] = bits if preds[a] else None
+    return redundant
@@ -0,0 +1,146 @@
+"""
+Fast reader for the dot files Doxygen generates.
+
+Doxygen writes one statement per line and uses only a small part of the DOT
+language, so these files can be read with a few regular expressions instead
+of building an ANTLR parse tree. scan() returns None for anything outside this
+dialect and the caller then falls back to the ANTLR grammar (DOT.g4).
+
+The statements are fed to a DOTReader in the same order the parse tree
+listener would see them, so both paths produce the same graph.
+"""
+
+import re
+
+# Token definitions follow DOT.g4.
+_ID = r'[A-Za-z_\x80-\xff][A-Za-z_0-9\x80-\xff]*'
+_STRING = r'"(?:\\"|\\(?!")|[^"\\])*"'
+_NUMBER = r'-?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)'
+_WS = r'[ \t\r]*'
+
+_KEYWORDS = frozenset(['strict', 'graph', 'digraph', 'node', 'edge',
+    'subgraph'])
+
+_HEADER = re.compile(r'{ws}digraph(?:[ \t\r]+(?:{id}|{string}))?{ws}(\{{)?{ws}$'
+        .format(ws=_WS, id=_ID, string=_STRING))
+_OPEN = re.compile(r'{ws}\{{{ws}$'.format(ws=_WS))
+_CLOSE = re.compile(r'{ws}\}}{ws}$'.format(ws=_WS))
+_STMT = re.compile(r'{ws}({id}){ws}(?:(?:->|--){ws}({id}){ws})?(?:\[(.*)\]{ws})?;?{ws}$'
+        .format(ws=_WS, id=_ID))
+_ASSIGN = re.compile(r'{ws}({id}){ws}={ws}(?:{string}|{number}|({id})){ws};?{ws}$'
+        .format(ws=_WS, id=_ID, string=_STRING, number=_NUMBER))
+_ATTR = re.compile(r'{ws}({id}|{string}){ws}={ws}({string}|{number}|({id})){ws},?'
+        .format(ws=_WS, id=_ID, string=_STRING, number=_NUMBER))
+_BLANK = re.compile(r'{ws}(?:/\*(?:[^*]|\*(?!/))*\*/{ws})?$'.format(ws=_WS))
+_LINE_COMMENT = re.compile(r'{ws}//'.format(ws=_WS))
+
+
+def _a_list(text):
+    """
+    Splits the contents of an attribute list into key and value texts.
+    Returns None if the list is not in the supported dialect.
+    """
+    keys = []
+    values = []
+    pos = 0
+    for m in _ATTR.finditer(text):
+        if m.start() != pos:
+            return None
+        key, value, id_value = m.groups()
+        if key.lower() in _KEYWORDS or (id_value is not None and
+                id_value.lower() in _KEYWORDS):
+            return None
+        keys.append(key)
+        values.append(value)
+        pos = m.end()
+    if text[pos:].strip(' \t\r') != '':
+        return None
+    return keys, values
+
+
+def scan(text):
+    """
+    Reads the statements of a Doxygen generated dot file. Returns a list of
+    (node1, node2, attrs) tuples, where node2 is None for node statements and
+    both nodes are None for attribute statements (node [...], edge [...]).
+    attrs is a (keys, values) tuple or None if the statement has no
+    attributes. Returns None if the text can't be read with this scanner.
+    """
+    if '\\\\' in text:
+        # Escaped backslashes make string boundaries ambiguous enough to
+        # leave them to ANTLR.
+        return None
+    statements = []
+    lines = text.split('\n')
+    last = len(lines) - 1
+    state = 0 # 0: before header, 1: before '{', 2: body, 3: after '}'
+    for i, line in enumerate(lines):
+        if _BLANK.match(line) or line.lstrip(' \t\r').startswith('#'):
+            continue
+        if _LINE_COMMENT.match(line):
+            if i == last:
+                # Line comments must end in a newline
+                return None
+            continue
+        if state == 2:
+            m = _STMT.match(line)
+            if m:
+                node1, node2, a_list = m.groups()
+                if a_list is not None:
+                    attrs = _a_list(a_list)
+                    if attrs is None:
+                        return None
+                    if len(attrs[0]) == 0:
+                        attrs = None
+                else:
+                    attrs = None
+                if node1.lower() in _KEYWORDS:
+                    if node2 is not None or attrs is None or \
+                            node1.lower() not in ('node', 'edge', 'graph'):
+                        return None
+                    statements.append((None, None, attrs))
+                elif node2 is not None:
+                    if node2.lower() in _KEYWORDS:
+                        return None
+                    statements.append((node1, node2, attrs))
+                else:
+                    statements.append((node1, None, attrs))
+                continue
+            m = _ASSIGN.match(line)
+            if m:
+                if m.group(1).lower() in _KEYWORDS or (m.group(2) is not None
+                        and m.group(2).lower() in _KEYWORDS):
+                    return None
+                continue
+            if _CLOSE.match(line):
+                state = 3
+                continue
+            return None
+        elif state == 0:
+            m = _HEADER.match(line)
+            if not m:
+                return None
+            state = 2 if m.group(1) else 1
+        elif state == 1:
+            if not _OPEN.match(line):
+                return None
+            state = 2
+        else:
+            return None
+    if state != 3:
+        return None
+    return statements
+
+
+def feed(statements, reader):
+    """
+    Feeds statements returned by scan() to a DOTReader.
+    """
+    for node1, node2, attrs in statements:
+        if node2 is not None:
+            reader.edge_stmt(node1, node2)
+        elif node1 is not None:
+            reader.node_stmt(node1)
+        if attrs is not None:
+            reader.a_list(*attrs)
+    reader.exit_graph()
@@ -0,0 +1,73 @@
+"""
+Splits a cleaned up graph by package for --shard-by cluster.
+
+Each shard has the nodes of one package and every edge with at least one end
+in it. The other end of an edge to another package is added as a stub: a
+copy of that node drawn dashed. The overview graph has a node per package
+and an edge between two packages labelled with the number of edges between
+them.
+"""
+
+# Style of the stub nodes standing for nodes of other packages
+STUB_STYLE = '"dashed"'
+
+
+def shard_name(pkg):
+    """
+    Returns the name of the shard of a package, usable in file names.
+    """
+    return pkg.replace('.', '') or 'other'
+
+
+def split(nodes, edges, pkg_name):
+    """
+    Returns a dict from package to the (nodes, edges) of its shard, and the
+    number of edges between each pair of packages. pkg_name(label) gives the
+    package of a node.
+    """
+    pkgs = {}
+    shards = {}
+    for label, attrs in nodes.items():
+        pkg = pkg_name(label)
+        pkgs[label] = pkg
+        shards.setdefault(pkg, ({}, {}))[0][label] = attrs
+    between = {}
+    for key, attrs in edges.items():
+        pkg1 = pkgs[key[0]]
+        pkg2 = pkgs[key[1]]
+        shards[pkg1][1][key] = attrs
+        if pkg1 == pkg2:
+            continue
+        shards[pkg2][1][key] = attrs
+        shards[pkg1][0].setdefault(key[1], dict(nodes[key[1]], style=STUB_STYLE))
+        shards[pkg2][0].setdefault(key[0], dict(nodes[key[0]], style=STUB_STYLE))
+        between[(pkg1, pkg2)] = between.get((pkg1, pkg2), 0) + 1
+    return shards, between
+
+
+def overview(pkgs, between, colors, bidir=False):
+    """
+    Returns the nodes and edges of the overview graph. colors maps packages
+    to node colours as PACKAGE_COLORS in the settings does. With bidir the
+    edges in both directions between two packages are joined.
+    """
+    other = colors.get('other', 'white')
+    nodes = {}
+    for pkg in pkgs:
+        label = '"{}"'.format(shard_name(pkg))
+        nodes[label] = {'label': label, 'color': colors.get(pkg, other),
+                'style': '"filled"'}
+    counts = {}
+    joined = set() # Edges that were joined with the other direction
+    for (pkg1, pkg2), count in between.items():
+        key = ('"{}"'.format(shard_name(pkg1)), '"{}"'.format(shard_name(pkg2)))
+        if bidir and key[::-1] in counts:
+            key = key[::-1]
+            joined.add(key)
+        counts[key] = counts.get(key, 0) + count
+    edges = {}
+    for key, count in counts.items():
+        edges[key] = {'label': '"{}"'.format(count)}
+        if key in joined:
+            edges[key]['dir'] = 'both'
+    return nodes, edges
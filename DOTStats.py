@@ -0,0 +1,187 @@
+"""
+Run statistics for --stats: wall and CPU time per stage, counters, filter
+hits and peak memory use, written as JSON or in the Prometheus textfile
+collector format.
+
+Stages are timed with DOTStats.timer() and the times of a stage are summed,
+so stages that are done once per file (parse, extract, merge) add up over all
+files. With --jobs the parse and extract times are measured in the parser
+processes and are the sum over all of them.
+"""
+
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+STAGES = ['discover', 'parse', 'extract', 'merge', 'filter', 'cleanup',
+        'focus', 'reduce', 'shard', 'write', 'store']
+
+
+class _Timer:
+
+    def __init__(self, stats, stage):
+        self._stats = stats
+        self._stage = stage
+
+    def __enter__(self):
+        if self._stats.profiler is not None:
+            self._stats.profiler.enter(self._stage)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def __exit__(self, *exc):
+        self._stats.add_time(self._stage, time.perf_counter() - self._wall,
+                time.process_time() - self._cpu)
+        if self._stats.profiler is not None:
+            self._stats.profiler.exit(self._stage)
+
+
+class DOTStats:
+
+    def __init__(self):
+        self.wall = {}
+        self.cpu = {}
+        self.counters = {}
+        self.filter_hits = {}
+        self.profiler = None # DOTProfiler following the stages, for --profile
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    def timer(self, stage):
+        """
+        Returns a context manager that adds the time spent in it to stage.
+        """
+        return _Timer(self, stage)
+
+    def add_time(self, stage, wall, cpu):
+        self.wall[stage] = self.wall.get(stage, 0.0) + wall
+        self.cpu[stage] = self.cpu.get(stage, 0.0) + cpu
+
+    def add_times(self, wall, cpu):
+        """
+        Adds the times of another DOTStats, e.g. from a parser process.
+        """
+        for stage in wall:
+            self.add_time(stage, wall[stage], cpu[stage])
+
+    def timed(self, items, stage):
+        """
+        Yields the items of an iterable, adding the time spent getting them
+        to stage.
+        """
+        it = iter(items)
+        while True:
+            with self.timer(stage):
+                item = next(it, self)
+            if item is self:
+                return
+            yield item
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def result(self):
+        """
+        Returns the statistics as a dict.
+        """
+        wall = time.perf_counter() - self._start
+        stages = {}
+        for stage in STAGES + sorted(set(self.wall) - set(STAGES)):
+            if stage in self.wall:
+                stages[stage] = {'wall': self.wall[stage],
+                        'cpu': self.cpu[stage]}
+        counters = dict(self.counters)
+        files = counters.get('files', 0)
+        result = {
+            'timestamp': time.time(),
+            'wall': wall,
+            'cpu': time.process_time() - self._start_cpu,
+            'stages': stages,
+            'counters': counters,
+            'files_per_second': files / wall if wall > 0 else 0.0,
+            'filter_hits': self.filter_hits,
+        }
+        result.update(peak_rss())
+        return result
+
+    def write(self, fname, fmt='json'):
+        """
+        Writes the statistics to fname. The file is replaced in one step, as
+        the Prometheus textfile collector requires.
+        """
+        result = self.result()
+        if fmt == 'prometheus':
+            text = prometheus_text(result)
+        else:
+            text = json.dumps(result, indent=2, sort_keys=True) + '\n'
+        tmp_name = fname + '.tmp'
+        with open(tmp_name, 'w') as f:
+            f.write(text)
+        os.replace(tmp_name, fname)
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process and of its finished
+    child processes in bytes.
+    """
+    if resource is None:
+        return {}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'peak_rss_children_bytes':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(result):
+    """
+    Formats the result of DOTStats.result() as Prometheus metrics.
+    """
+    lines = []
+    def metric(name, help_text, samples):
+        lines.append('# HELP dotcomb_{} {}'.format(name, help_text))
+        lines.append('# TYPE dotcomb_{} gauge'.format(name))
+        for labels, value in samples:
+            text = ''
+            if labels:
+                text = '{' + ','.join(['{}="{}"'.format(k, _label(v))
+                    for k, v in labels]) + '}'
+            if not isinstance(value, int):
+                value = repr(float(value))
+            lines.append('dotcomb_{}{} {}'.format(name, text, value))
+
+    stages = result['stages']
+    metric('stage_seconds', 'Wall time spent in each stage.',
+            [([('stage', s)], stages[s]['wall']) for s in stages])
+    metric('stage_cpu_seconds', 'CPU time spent in each stage.',
+            [([('stage', s)], stages[s]['cpu']) for s in stages])
+    metric('run_seconds', 'Wall time of the whole run.', [((), result['wall'])])
+    metric('run_cpu_seconds', 'CPU time of the whole run.', [((), result['cpu'])])
+    metric('files_per_second', 'Files read per second.',
+            [((), result['files_per_second'])])
+    for name in sorted(result['counters']):
+        metric(name, 'Number of {}.'.format(name.replace('_', ' ')),
+                [((), result['counters'][name])])
+    metric('filter_hits', 'Number of distinct nodes removed by each filter '
+            'pattern.', [([('stage', stage), ('pattern', pattern)], hits)
+                for stage in sorted(result['filter_hits'])
+                for pattern, hits in sorted(result['filter_hits'][stage].items())])
+    for key in ('peak_rss_bytes', 'peak_rss_children_bytes'):
+        if key in result:
+            metric(key, 'Peak resident set size.', [((), result[key])])
+    metric('last_run_timestamp_seconds', 'Time the run finished.',
+            [((), result['timestamp'])])
+    return '\n'.join(lines) + '\n'
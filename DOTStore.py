@@ -0,0 +1,258 @@
+"""
+SQLite store of a combined graph for --store and dotcomb.py query.
+
+The cleaned up nodes and edges are saved with their attributes, their
+package and the dot files they came from. Edges are indexed both ways, so
+fan-in, fan-out and path queries only read the rows they need. Nodes and
+edges keep the order they were merged in, so writing the whole stored graph
+gives the same output as the run that saved it.
+"""
+
+import json
+import os
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE files (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE nodes (id INTEGER PRIMARY KEY, label TEXT UNIQUE, name TEXT,
+    package TEXT, attrs TEXT);
+CREATE INDEX nodes_name ON nodes (name);
+CREATE INDEX nodes_package ON nodes (package);
+CREATE TABLE edges (src INTEGER, dst INTEGER, seq INTEGER, attrs TEXT,
+    PRIMARY KEY (src, dst)) WITHOUT ROWID;
+CREATE INDEX edges_dst ON edges (dst, src);
+CREATE TABLE node_files (node INTEGER, file INTEGER,
+    PRIMARY KEY (node, file)) WITHOUT ROWID;
+CREATE TABLE edge_files (src INTEGER, dst INTEGER, file INTEGER,
+    PRIMARY KEY (src, dst, file)) WITHOUT ROWID;
+'''
+
+
+class Provenance:
+    """
+    Remembers which files each node and edge was read from.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.nodes = {} # Label -> file indexes
+        self.edges = {} # (label1, label2) -> file indexes
+
+    def add(self, fname, nodes, edges):
+        i = len(self.files)
+        self.files.append(fname)
+        for label in nodes:
+            self.nodes.setdefault(label, []).append(i)
+        for key in edges:
+            self.edges.setdefault(key, []).append(i)
+
+
+def save(fname, nodes, edges, pkg_name, provenance=None, meta=None):
+    """
+    Saves nodes and edges to a new database fname, replacing any old one
+    when done. pkg_name(label) gives the package of a node.
+    """
+    tmp_name = fname + '.tmp'
+    if os.path.exists(tmp_name):
+        os.remove(tmp_name)
+    db = sqlite3.connect(tmp_name)
+    try:
+        db.execute('PRAGMA journal_mode=OFF')
+        db.execute('PRAGMA synchronous=OFF')
+        db.executescript(SCHEMA)
+        db.executemany('INSERT INTO meta VALUES (?, ?)',
+                sorted((meta or {}).items()))
+        ids = {label: i for i, label in enumerate(nodes)}
+        db.executemany('INSERT INTO nodes VALUES (?, ?, ?, ?, ?)',
+                ((i, label, label.replace('"', ''), pkg_name(label),
+                    json.dumps(dict(nodes[label]))) for label, i in ids.items()))
+        db.executemany('INSERT INTO edges VALUES (?, ?, ?, ?)',
+                ((ids[key[0]], ids[key[1]], seq, json.dumps(attrs))
+                    for seq, (key, attrs) in enumerate(edges.items())))
+        if provenance is not None:
+            db.executemany('INSERT INTO files VALUES (?, ?)',
+                    enumerate(provenance.files))
+            db.executemany('INSERT INTO node_files VALUES (?, ?)',
+                    ((ids[label], i) for label, files in provenance.nodes.items()
+                        if label in ids for i in set(files)))
+            db.executemany('INSERT OR IGNORE INTO edge_files VALUES (?, ?, ?)',
+                    ((ids[key[0]], ids[key[1]], i)
+                        for key, files in _edge_files(provenance, edges)
+                        for i in files))
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_name, fname)
+
+
+def _edge_files(provenance, edges):
+    """
+    Yields the key and files of each edge in edges. With --bidir an edge read
+    from a file can be stored the other way round.
+    """
+    for key, files in provenance.edges.items():
+        if key in edges:
+            yield key, files
+        elif (key[1], key[0]) in edges:
+            yield (key[1], key[0]), files
+
+
+class DOTStore:
+    """
+    Queries a database written by save().
+    """
+
+    def __init__(self, fname):
+        if not os.path.exists(fname):
+            raise FileNotFoundError(fname)
+        self._db = sqlite3.connect('file:{}?mode=ro'.format(fname), uri=True)
+
+    def close(self):
+        self._db.close()
+
+    def meta(self):
+        return dict(self._db.execute('SELECT key, value FROM meta'))
+
+    def node_id(self, name):
+        """
+        Returns the id of a node by its label, with or without quotes, or
+        None.
+        """
+        row = self._db.execute('SELECT id FROM nodes WHERE name=?',
+                (name.replace('"', ''),)).fetchone()
+        return None if row is None else row[0]
+
+    def find(self, patterns):
+        """
+        Returns the ids of the nodes whose labels, without quotes, match any
+        of the patterns (with * and ? wildcards).
+        """
+        ids = set()
+        for pattern in patterns:
+            ids.update([row[0] for row in self._db.execute(
+                'SELECT id FROM nodes WHERE name GLOB ?', (pattern,))])
+        return ids
+
+    def label(self, i):
+        return self._db.execute('SELECT label FROM nodes WHERE id=?',
+                (i,)).fetchone()[0]
+
+    def neighbours(self, i, direction):
+        """
+        Returns the ids of the nodes with an edge from ('out') or to ('in')
+        node i.
+        """
+        if direction == 'out':
+            sql = 'SELECT dst FROM edges WHERE src=?'
+        else:
+            sql = 'SELECT src FROM edges WHERE dst=?'
+        return [row[0] for row in self._db.execute(sql, (i,))]
+
+    def fan(self, i, direction):
+        """
+        Returns the labels of the nodes with an edge from or to node i.
+        """
+        if direction == 'out':
+            sql = ('SELECT n.label FROM edges e JOIN nodes n ON n.id=e.dst '
+                    'WHERE e.src=? ORDER BY n.name')
+        else:
+            sql = ('SELECT n.label FROM edges e JOIN nodes n ON n.id=e.src '
+                    'WHERE e.dst=? ORDER BY n.name')
+        return [row[0] for row in self._db.execute(sql, (i,))]
+
+    def top_fan(self, direction, count):
+        """
+        Returns (label, number of edges) of the count nodes with the most
+        edges out or in.
+        """
+        column = 'src' if direction == 'out' else 'dst'
+        return self._db.execute('SELECT n.label, c FROM (SELECT {0}, count(*) '
+                'AS c FROM edges GROUP BY {0} ORDER BY c DESC LIMIT ?) '
+                'JOIN nodes n ON n.id={0} ORDER BY c DESC, n.name'.format(column),
+                (count,)).fetchall()
+
+    def path(self, start, end, max_hops=-1):
+        """
+        Returns the labels of a shortest path from node start to node end, or
+        None if there is none within max_hops edges.
+        """
+        previous = {start: None}
+        frontier = [start]
+        while frontier and max_hops != 0 and not end in previous:
+            next_frontier = []
+            for i in frontier:
+                for j in self.neighbours(i, 'out'):
+                    if not j in previous:
+                        previous[j] = i
+                        next_frontier.append(j)
+            frontier = next_frontier
+            max_hops -= 1
+        if not end in previous:
+            return None
+        path = []
+        i = end
+        while i is not None:
+            path.append(self.label(i))
+            i = previous[i]
+        return path[::-1]
+
+    def neighbourhood(self, ids, hops, direction='both'):
+        """
+        Returns the ids of the nodes at most hops edges away from the given
+        nodes, like EdgeIndex.neighbourhood().
+        """
+        directions = ['out', 'in'] if direction == 'both' else [direction]
+        seen = set(ids)
+        frontier = list(seen)
+        while frontier and hops != 0:
+            next_frontier = []
+            for i in frontier:
+                for d in directions:
+                    for j in self.neighbours(i, d):
+                        if not j in seen:
+                            seen.add(j)
+                            next_frontier.append(j)
+            frontier = next_frontier
+            hops -= 1
+        return seen
+
+    def package_edges(self):
+        """
+        Returns (package1, package2, number of edges) for the edges between
+        different packages.
+        """
+        return self._db.execute('SELECT a.package, b.package, count(*) AS c '
+                'FROM edges e JOIN nodes a ON a.id=e.src '
+                'JOIN nodes b ON b.id=e.dst WHERE a.package != b.package '
+                'GROUP BY a.package, b.package ORDER BY c DESC, 1, 2').fetchall()
+
+    def files(self, i):
+        """
+        Returns the files node i was read from.
+        """
+        return [row[0] for row in self._db.execute('SELECT f.name FROM '
+            'node_files nf JOIN files f ON f.id=nf.file WHERE nf.node=? '
+            'ORDER BY f.id', (i,))]
+
+    def graph(self, ids=None, packages=None):
+        """
+        Returns the nodes and edges among the nodes with the given ids and in
+        the given packages, or all of them, as dicts in merge order.
+        """
+        nodes = {}
+        labels = {}
+        for i, label, package, attrs in self._db.execute(
+                'SELECT id, label, package, attrs FROM nodes ORDER BY id'):
+            if ids is not None and not i in ids:
+                continue
+            if packages is not None and not package in packages:
+                continue
+            nodes[label] = json.loads(attrs)
+            labels[i] = label
+        edges = {}
+        for src, dst, attrs in self._db.execute(
+                'SELECT src, dst, attrs FROM edges ORDER BY seq'):
+            if src in labels and dst in labels:
+                edges[(labels[src], labels[dst])] = json.loads(attrs)
+        return nodes, edges
@@ -0,0 +1,84 @@
+"""
+Keeps the combined graph of a directory up to date for --watch.
+
+The nodes and edges read from each file are kept separately. When files are
+added, changed or removed only those files are parsed again, and the combined
+graph is merged again from the kept results in file order. Merging follows
+the same rules as a normal run (the first file defining a node decides its
+attributes, later edges overwrite earlier ones, with bidir reverse edges
+become bidirectional), so a removed or changed file's nodes and edges are
+retracted exactly and the output is the same as a run from scratch.
+"""
+
+import logging
+import os
+
+from DOTGraph import DOTGraph
+
+
+class DOTWatcher:
+
+    def __init__(self, find_files, read_files, bidir=False,
+            graph_type=DOTGraph):
+        """
+        find_files() returns the dot files to watch, in merge order.
+        read_files(files) yields (fname, nodes, edges, ignored_nodes) for each
+        of the given files. graph_type is DOTGraph or BatchGraph.
+        """
+        self._find_files = find_files
+        self._read_files = read_files
+        self.bidir = bidir
+        self.graph_type = graph_type
+        self.files = []
+        self._stats = {} # File -> (mtime_ns, size) when it was read
+        self._results = {} # File -> (nodes, edges, ignored_nodes)
+
+    def poll(self):
+        """
+        Looks for added, changed and removed files. Returns the current list
+        of files, the files that need to be read and the removed files.
+        """
+        files = []
+        changed = []
+        stats = {}
+        for fname in self._find_files():
+            try:
+                st = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            files.append(fname)
+            stats[fname] = (st.st_mtime_ns, st.st_size)
+            if self._stats.get(fname) != stats[fname]:
+                changed.append(fname)
+        removed = [fname for fname in self._stats if not fname in stats]
+        return files, changed, removed, stats
+
+    def update(self):
+        """
+        Reads the files that have changed since the last call. Returns True
+        if the graph has changed.
+        """
+        files, changed, removed, stats = self.poll()
+        if not changed and not removed and files == self.files:
+            return False
+        for fname in removed:
+            logging.info('Removed %s', fname)
+            del self._stats[fname]
+            del self._results[fname]
+        for fname, nodes, edges, ignored in self._read_files(changed):
+            logging.info('Read %s', fname)
+            self._stats[fname] = stats[fname]
+            self._results[fname] = (nodes, edges, ignored)
+        # A file that disappeared while it was being read is picked up as
+        # removed on the next call.
+        self.files = [fname for fname in files if fname in self._results]
+        return True
+
+    def graph(self):
+        """
+        Returns a new graph of all files.
+        """
+        graph = self.graph_type(self.bidir)
+        for fname in self.files:
+            graph.add_file(*self._results[fname])
+        return graph
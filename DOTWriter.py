@@ -0,0 +1,206 @@
+"""
+Writes the combined graph as a Graphviz dot file.
+
+The output is produced by generators that yield the text of the file piece by
+piece. write() joins the pieces into large chunks and writes them to a single
+buffered file handle, which is much faster than printing every node and edge
+separately.
+"""
+
+import itertools
+
+# Default size of the chunks written to the output file, in characters.
+BUFFER_SIZE = 1024 * 1024
+# Number of nodes or edges formatted at a time.
+BATCH_SIZE = 1000
+
+
+class DOTWriter:
+
+    def __init__(self, settings, params, packages):
+        self._settings = settings
+        self._params = params
+        self._packages = packages
+        self._cluster = 0
+        self._attrs_cache = {}
+        self._node_cache = {} # id of a NodeAttrs.base -> (base, text parts)
+
+    def node_lines(self, nodes, index):
+        """
+        Yields nodes that have edges, formatted in one batch. If index is None
+        the nodes are known to have edges.
+        """
+        yield ''.join(["\t{}\n\t\t[{}];\n\n".format(key, self._node_text(node))
+            for key, node in nodes if index is None or index.has_edges(key)])
+
+    def _node_text(self, node):
+        """
+        Returns the attribute list of a node. The text of the attribute set
+        NodeAttrs share is cached, so only their label is formatted.
+        """
+        base = getattr(node, 'base', None)
+        if base is None:
+            return ',\n\t\t'.join([k+'='+v for k,v in sorted(node.items())])
+        entry = self._node_cache.get(id(base))
+        if entry is None:
+            items = sorted(base.items())
+            before = ''.join([k+'='+v+',\n\t\t' for k,v in items if k < 'label'])
+            after = ''.join([',\n\t\t'+k+'='+v for k,v in items if k > 'label'])
+            # Keep base so that its id is not reused
+            entry = (base, before + 'label=', after)
+            self._node_cache[id(base)] = entry
+        return entry[1] + node.label + entry[2]
+
+    def subgraph_lines(self, k, g, index):
+        """
+        Yields subgraph info if -c command-line parameter was supplied,
+        otherwise just each node in a group at once.
+        """
+        if self._params['cluster']:
+            yield '\tsubgraph cluster_{} {{\n'.format(self._cluster)
+            if len(k) > 0:
+                yield '\t\tlabel={};\n'.format(k)
+                yield '\t\tfontsize=48;\n'
+            else:
+                yield '\t\tlabel=\"\";\n'
+        for batch in batches(g):
+            yield from self.node_lines(batch, index)
+        if self._params['cluster']:
+            yield '\t}\n'
+            self._cluster = self._cluster + 1
+
+    def sort_func(self, x):
+        """
+        Return package name if clustering is defined, otherwise label name in
+        lower case
+        """
+        if self._params['cluster'] is True:
+            return self._packages.pkg_name(x[0].lower())
+        else:
+            return x[0].lower()
+
+    def sort_nodes(self, nodes):
+        """
+        Returns the (label, attributes) pairs of nodes sorted by group.
+        """
+        sorted_nodes = [d for d in nodes.items()]
+        sorted_nodes.sort(key=self.sort_func)
+        return sorted_nodes
+
+    def nodes_lines(self, sorted_nodes, index):
+        """
+        Yields all nodes, which must already be sorted by group.
+        """
+        if not self._params['cluster']:
+            # Without clusters every group would be a single node
+            for batch in batches(sorted_nodes):
+                yield from self.node_lines(batch, index)
+            return
+        for k,v in itertools.groupby(sorted_nodes, self.sort_func):
+            yield from self.subgraph_lines(k, v, index)
+
+    def sort_edges(self, edges):
+        """
+        Returns the ((node1, node2), attributes) pairs of edges in output
+        order.
+        """
+        return sorted(edges.items(), key=lambda k: edge_sort_key(k[0]))
+
+    def edges_lines(self, sorted_edges):
+        """
+        Yields all edges, which must already be sorted.
+        """
+        arrow = '->'
+        for batch in batches(sorted_edges):
+            yield ''.join(["\t{} {} {}\n\t\t[{}];\n\n".format(k[0], arrow, k[1],
+                self._attrs_text(v)) for k, v in batch])
+
+    def _attrs_text(self, attrs):
+        """
+        Returns the attribute list of an edge. Most edges have the same
+        attributes, so the text is cached.
+        """
+        key = tuple(attrs.items())
+        text = self._attrs_cache.get(key)
+        if text is None:
+            text = ',\n\t\t'.join([k+'='+v for k,v in sorted(attrs.items())])
+            self._attrs_cache[key] = text
+        return text
+
+    def legend_lines(self, components):
+        yield ('\t{ rank=same; 0 [style=invis] }'
+                    '\n\tedge [style=invis];'
+                    '\n\tfontcolor=black;\n\n')
+        nodes = '->'.join(sorted(components)).replace('.', '')
+        yield '\t{};\n'.format(nodes)
+        for c in sorted(components):
+            component = c.replace('.', '')
+            yield ('\t{} [label={}, color={}, style=filled, fontsize=24];\n'
+                    .format(component, component, components[c]))
+
+    def lines(self, sorted_nodes, index, sorted_edges):
+        """
+        Yields the whole dot file: header, nodes, edges, legend and footer.
+        Nodes and edges can be any iterables in the order given by
+        sort_nodes() and sort_edges().
+        """
+        yield self._settings['HEADER'].replace('$HEADER$', self._params['header']) + '\n'
+        yield from self.nodes_lines(sorted_nodes, index)
+        yield from self.edges_lines(sorted_edges)
+        if self._params['cluster'] is False and 'PACKAGE_COLORS' in self._settings:
+            yield from self.legend_lines(self._settings['PACKAGE_COLORS'])
+        yield self._settings['FOOTER'] + '\n'
+
+    def write(self, f, nodes, index, edges, buffer_size=BUFFER_SIZE):
+        """
+        Writes the dot file to f in chunks of about buffer_size characters.
+        """
+        self.write_sorted(f, self.sort_nodes(nodes), index,
+                self.sort_edges(edges), buffer_size)
+
+    def write_sorted(self, f, sorted_nodes, index, sorted_edges,
+            buffer_size=BUFFER_SIZE):
+        """
+        Writes nodes and edges that are already in the order given by
+        sort_nodes() and sort_edges().
+        """
+        write_chunks(f, self.lines(sorted_nodes, index, sorted_edges),
+                buffer_size)
+
+
+def edge_sort_key(key):
+    """
+    Sort key of an edge. Quotes are removed and the labels converted to lower
+    case for a more logical order.
+    """
+    return (key[0]+key[1]).replace('"', '').lower()
+
+
+def batches(items):
+    """
+    Splits an iterable into lists of BATCH_SIZE items.
+    """
+    it = iter(items)
+    batch = list(itertools.islice(it, BATCH_SIZE))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(it, BATCH_SIZE))
+
+
+def write_chunks(f, lines, buffer_size=BUFFER_SIZE):
+    """
+    Joins the strings from lines into chunks of about buffer_size characters
+    and writes them to f.
+    """
+    buf = []
+    size = 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            f.write(''.join(buf))
+            buf = []
+            size = 0
+    if buf:
+        f.write(''.join(buf))
+    f.flush()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""
+Compares the old edge scan used to find nodes without edges with the
+EdgeIndex lookup on a synthetic graph.
+
+The scan is O(N*E), so it is only timed for a sample of the nodes and the
+total is extrapolated from that.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from DOTGraph import EdgeIndex
+
+
+def scan_has_edges(node_label, edges):
+    """ The pre-index implementation of has_edges. """
+    return len([
+        k for k in edges.keys() if k[0] == node_label or k[1] == node_label]) > 0
+
+
+def synthetic_graph(n_nodes, n_edges, seed):
+    r = random.Random(seed)
+    nodes = ['"com.example.pkg{}.Class{}"'.format(i % 50, i) for i in range(n_nodes)]
+    edges = {}
+    while len(edges) < n_edges:
+        edges[(r.choice(nodes), r.choice(nodes))] = {'color': '"midnightblue"'}
+    return nodes, edges
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    p.add_argument('--nodes', '-n', type=int, default=100000)
+    p.add_argument('--edges', '-e', type=int, default=300000)
+    p.add_argument('--sample', type=int, default=20,
+            help='Number of nodes to time the edge scan with.')
+    p.add_argument('--seed', type=int, default=1)
+    args = p.parse_args(argv)
+
+    nodes, edges = synthetic_graph(args.nodes, args.edges, args.seed)
+    print('Graph: {} nodes, {} edges'.format(len(nodes), len(edges)))
+
+    start = time.perf_counter()
+    for label in nodes[:args.sample]:
+        scan_has_edges(label, edges)
+    scan = (time.perf_counter() - start) / args.sample * len(nodes)
+    print('Edge scan:  {:10.2f} s (extrapolated from {} nodes)'
+            .format(scan, args.sample))
+
+    start = time.perf_counter()
+    index = EdgeIndex(edges.keys())
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    for label in nodes:
+        index.has_edges(label)
+    lookup = time.perf_counter() - start
+    print('Edge index: {:10.2f} s (build {:.2f} s, lookups {:.2f} s)'
+            .format(built + lookup, built, lookup))
+    print('Speed-up:   {:10.0f}x'.format(scan / (built + lookup)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
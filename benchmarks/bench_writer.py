@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+"""
+Compares printing every node and edge with print() against DOTWriter on
+synthetic graphs of chromium.dot size and larger, and checks that both
+produce the same output.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import yaml
+from DOTGraph import EdgeIndex
+from DOTPackage import PackageResolver
+from DOTWriter import DOTWriter, BUFFER_SIZE
+
+# Size of chromium.dot
+NODES = 150
+EDGES = 80
+
+
+def print_output(settings, params, nodes, edges, f):
+    """ The print() based output used before DOTWriter. """
+    def print_node(key, node):
+        print("\t{}\n\t\t[{}];\n".format(key, ',\n\t\t'.join([key+'='+v for
+            key,v in sorted(node[1].items())])), file = f)
+    print("{}".format(settings['HEADER'].replace('$HEADER$', params['header'])), file=f)
+    sorted_nodes = [d for d in nodes.items()]
+    sorted_nodes.sort(key=lambda x: x[0].lower())
+    for k,v in itertools.groupby(sorted_nodes, lambda x: x[0].lower()):
+        for node in v:
+            print_node(node[0], node)
+    sorted_edges = sorted(edges.items(), key=lambda k: (k[0][0]+k[0][1]).replace('"', '').lower())
+    for k, v in sorted_edges:
+        sorted_values = sorted(v.items())
+        print("\t{} {} {}\n\t\t[{}];\n".format(k[0], '->', k[1], ',\n\t\t'.join([k+'='+v2 for
+            k,v2 in sorted_values])), file=f)
+    components = settings['PACKAGE_COLORS']
+    print('\t{ rank=same; 0 [style=invis] }'
+                '\n\tedge [style=invis];'
+                '\n\tfontcolor=black;\n', file = f)
+    print('\t{};'.format('->'.join(sorted(components)).replace('.', '')), file = f)
+    for c in sorted(components):
+        component = c.replace('.', '')
+        print('\t{} [label={}, color={}, style=filled, fontsize=24];'
+                .format(component, component, components[c]), file = f)
+    print("{}".format(settings['FOOTER']), file=f)
+
+
+def synthetic_graph(n_nodes, n_edges, seed):
+    r = random.Random(seed)
+    nodes = {}
+    for i in range(n_nodes):
+        label = '"org.chromium.chrome.pkg{}.Class{}"'.format(i % 20, i)
+        nodes[label] = {'label': label, 'height': '0.2', 'width': '0.4',
+                'color': 'white', 'style': '"filled"', 'group': 'pkg'}
+    labels = list(nodes)
+    edges = {}
+    while len(edges) < n_edges:
+        edges[(r.choice(labels), r.choice(labels))] = {
+                'color': '"midnightblue"', 'fontsize': '"10"',
+                'style': '"solid"', 'fontname': '"Helvetica"'}
+    return nodes, edges
+
+
+def timed(func, path, buffering):
+    start = time.perf_counter()
+    with open(path, 'w', buffering=buffering) as f:
+        func(f)
+    return time.perf_counter() - start
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    p.add_argument('--scales', default='1,100,1000',
+            help='Comma separated multiples of the chromium.dot size.')
+    p.add_argument('--buffer-size', type=int, default=BUFFER_SIZE)
+    p.add_argument('--settings', default=os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), '..', 'settings.yaml'))
+    args = p.parse_args(argv)
+
+    with open(args.settings) as f:
+        settings = yaml.safe_load(f)
+    params = {'cluster': False, 'header': 'benchmark'}
+    packages = PackageResolver(settings)
+    tmp = tempfile.mkdtemp()
+    old_path = os.path.join(tmp, 'print.dot')
+    new_path = os.path.join(tmp, 'writer.dot')
+
+    print('{:>6} {:>8} {:>8} {:>10} {:>10} {:>8}'.format('scale', 'nodes',
+            'edges', 'print s', 'writer s', 'speed-up'))
+    for scale in [int(x) for x in args.scales.split(',')]:
+        nodes, edges = synthetic_graph(NODES * scale, EDGES * scale, scale)
+        index = EdgeIndex(edges.keys())
+        nodes = {k: v for k, v in nodes.items() if index.has_edges(k)}
+        old = timed(lambda f: print_output(settings, params, nodes, edges, f),
+                old_path, -1)
+        writer = DOTWriter(settings, params, packages)
+        new = timed(lambda f: writer.write(f, nodes, index, edges,
+                args.buffer_size), new_path, args.buffer_size)
+        with open(old_path) as f1, open(new_path) as f2:
+            same = f1.read() == f2.read()
+        print('{:>6} {:>8} {:>8} {:>10.4f} {:>10.4f} {:>7.1f}x{}'.format(scale,
+                len(nodes), len(edges), old, new, old / new,
+                '' if same else '  OUTPUT DIFFERS'))
+        os.remove(old_path)
+        os.remove(new_path)
+    os.rmdir(tmp)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+"""
+Checks that DOTDriver gives the same statements as a full ANTLR parse.
+
+DOTDriver reuses one parser, tries SLL prediction with an error strategy that
+gives up first and gets the statements from parse events instead of a tree.
+Here every text is also parsed the way it was before: with a new parser in LL
+mode with error recovery, walking the parse tree. The statements and the
+syntax errors printed must be the same. The texts are the files of a Doxygen
+tree (a generated one by default), DOT written by hand with the parts of the
+language Doxygen does not use, and random edits of both. Needs the ANTLR
+runtime.
+
+Example:
+
+    benchmarks/check_driver.py --files 50 --edits 5000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+from antlr4 import CommonTokenStream, InputStream, ParseTreeWalker
+
+from DOTDriver import DOTDriver, DOTStatementListener
+from DOTLexer import DOTLexer
+from DOTParser import DOTParser
+from DOTReader import StatementRecorder
+
+import generate
+from check_scanner import PIECES, mutate, read_texts
+
+TEXTS = [
+    'digraph { a -> b -> c [x=y]; subgraph s { a -> d }; {a b} -> c; '
+    'e -> {f g}; h:p:n -> i:q [k=l] }',
+    'strict graph G { a -- b; x = y; node [s=t]; edge [u=v] graph [w=z] }',
+    'digraph { a -> subgraph { b [c=d] } [e=f] }',
+    'digraph "g" { "a b" -> "c\\"d" [label=<x<b>y</b>>, w=1.5]; '
+    '/* comment */ c // line\n -> d; #p\n }',
+]
+
+
+def tree_statements(text):
+    """
+    Returns the statements of text from a new parser in LL mode with error
+    recovery, like before DOTDriver.
+    """
+    parser = DOTParser(CommonTokenStream(DOTLexer(InputStream(text))))
+    tree = parser.graph()
+    recorder = StatementRecorder()
+    ParseTreeWalker.DEFAULT.walk(DOTStatementListener(recorder), tree)
+    return recorder.statements
+
+
+def run(parse, text):
+    """
+    Returns what parse(text) returns, or the name of the exception it
+    raised, and what it printed.
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stderr(out), contextlib.redirect_stdout(out):
+        try:
+            result = parse(text)
+        except Exception as e:
+            result = type(e).__name__
+    return result, out.getvalue()
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    generate.add_arguments(p)
+    p.set_defaults(files=50)
+    p.add_argument('--directory', '-d', default='',
+            help='Check an existing Doxygen tree instead of a generated one.')
+    p.add_argument('--limit', type=int, default=200,
+            help='Maximum number of files to read.')
+    p.add_argument('--edits', type=int, default=5000,
+            help='Number of randomly edited texts to check.')
+    args = p.parse_args(argv)
+
+    tmp = None
+    directory = args.directory
+    if directory == '':
+        tmp = tempfile.mkdtemp(prefix='dotcomb-check')
+        directory = tmp
+        generate.generate(directory, args.files, args.nodes_per_file,
+                args.depth, args.filter_hits, args.type, args.seed)
+    try:
+        texts = read_texts(directory, args.limit) + TEXTS
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+
+    driver = DOTDriver()
+    r = random.Random(args.seed)
+    pieces = PIECES + ['<b>', 'p']
+    mismatches = 0
+    for i in range(len(texts) + args.edits):
+        if i < len(texts):
+            text = texts[i]
+        else:
+            text = mutate(r.choice(texts), r, pieces)
+        result = run(driver.statements, text)
+        expected = run(tree_statements, text)
+        if result != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print('MISMATCH {!r}'.format(text))
+                print('  DOTDriver: {}'.format(result))
+                print('  LL parse:  {}'.format(expected))
+    print('{} texts, {} parsed with SLL, {} with LL, {} mismatches'.format(
+        len(texts) + args.edits, driver.sll_files, driver.ll_files,
+        mismatches))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
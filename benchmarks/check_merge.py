@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+"""
+Checks that BatchGraph (--merge batch) merges files like DOTGraph.
+
+Random small files are merged both ways, with and without bidir: edges found
+again with other attributes, edges going the other way, self loops and nodes
+defined in several files. The edges are also read between files, which
+consolidates the rows collected so far, and the batch size is varied so that
+the automatic consolidation runs too. The edges (in order, with their
+attributes), the edge index, the nodes and the ignored nodes must be the
+same. Finally the files of a Doxygen tree (a generated one by default) are
+read with DOTReader and merged both ways. Needs numpy.
+
+Example:
+
+    benchmarks/check_merge.py --trials 5000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+import yaml
+import dotcomb
+from DOTGraph import DOTGraph, BatchGraph
+
+import generate
+
+ATTRS = [{'color': '"midnightblue"'}, {'color': '"darkorchid3"',
+    'dir': '"back"'}, {'style': '"dashed"', 'label': '" m_x"'}, {'dir': 'both'},
+    {}]
+
+
+def random_file(r, labels):
+    """
+    Returns the nodes, edges and ignored nodes of a random file.
+    """
+    nodes = {}
+    for i in range(r.randint(0, 4)):
+        label = r.choice(labels)
+        nodes[label] = dict(r.choice(ATTRS), label=label)
+    edges = {}
+    for i in range(r.randint(0, 10)):
+        edges[(r.choice(labels), r.choice(labels))] = dict(r.choice(ATTRS))
+    ignored = {label: label for label in r.sample(labels,
+        r.randint(0, min(2, len(labels))))}
+    return nodes, edges, ignored
+
+
+def difference(graph, batch):
+    """
+    Returns what differs between a DOTGraph and a BatchGraph, or None.
+    """
+    if list(graph.edges.items()) != list(batch.edges.items()):
+        return 'edges {} != {}'.format(list(graph.edges.items()),
+                list(batch.edges.items()))
+    if (graph.index.succ != batch.index.succ or
+            graph.index.pred != batch.index.pred):
+        return 'edge index'
+    if list(graph.nodes.items()) != list(batch.nodes.items()):
+        return 'nodes'
+    if graph.ignored_nodes != batch.ignored_nodes:
+        return 'ignored nodes'
+    return None
+
+
+def check_random(trials, r):
+    """
+    Merges random files into both graphs. Returns the number of trials that
+    differ.
+    """
+    mismatches = 0
+    for trial in range(trials):
+        bidir = r.random() < 0.5
+        labels = ['"n{}"'.format(i) for i in range(r.randint(1, 8))]
+        graph = DOTGraph(bidir)
+        batch = BatchGraph(bidir, batch_edges=r.choice([1, 3, 10, 1000]))
+        for i in range(r.randint(0, 6)):
+            nodes, edges, ignored = random_file(r, labels)
+            graph.add_file(nodes, edges, ignored)
+            batch.add_file(nodes, edges, ignored)
+            if r.random() < 0.2:
+                batch.edges
+        diff = difference(graph, batch)
+        if diff is not None:
+            mismatches += 1
+            if mismatches <= 3:
+                print('MISMATCH bidir={}: {}'.format(bidir, diff))
+    return mismatches
+
+
+def check_directory(directory, settings):
+    """
+    Reads the files under directory into both graphs, with and without
+    bidir. Returns the number of differing graphs.
+    """
+    mismatches = 0
+    for bidir in (False, True):
+        argv = ['-f', '-d', directory] + (['-b'] if bidir else [])
+        dotcomb.init_worker(settings, dotcomb.read_params(argv))
+        files = list(dotcomb.discover_files())
+        graph = DOTGraph(bidir)
+        batch = BatchGraph(bidir, batch_edges=len(files))
+        for fname, nodes, edges, ignored in dotcomb.read_file_results(files):
+            graph.add_file(nodes, edges, ignored)
+            batch.add_file(nodes, edges, ignored)
+        diff = difference(graph, batch)
+        if diff is not None:
+            mismatches += 1
+            print('MISMATCH in {} with bidir={}: {}'.format(directory, bidir,
+                diff[:200]))
+        else:
+            print('{} files, {} edges merged with bidir={}'.format(
+                len(files), len(graph.edges), bidir))
+    return mismatches
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    generate.add_arguments(p)
+    p.set_defaults(files=500)
+    p.add_argument('--directory', '-d', default='',
+            help='Check an existing Doxygen tree instead of a generated one.')
+    p.add_argument('--trials', type=int, default=3000,
+            help='Number of random graphs to merge.')
+    p.add_argument('--settings', default=os.path.join(BENCH_DIR, '..',
+            'settings.yaml'))
+    args = p.parse_args(argv)
+
+    with open(args.settings) as f:
+        settings = yaml.safe_load(f)
+
+    mismatches = check_random(args.trials, random.Random(args.seed))
+    print('{} random graphs, {} mismatches'.format(args.trials, mismatches))
+
+    tmp = None
+    directory = args.directory
+    if directory == '':
+        tmp = tempfile.mkdtemp(prefix='dotcomb-check')
+        directory = tmp
+        generate.generate(directory, args.files, args.nodes_per_file,
+                args.depth, args.filter_hits, args.type, args.seed)
+    try:
+        mismatches += check_directory(directory, settings)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
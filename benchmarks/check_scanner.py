@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""
+Checks that DOTScanner reads dot files exactly like the ANTLR grammar.
+
+Every file of a Doxygen tree (a generated one by default) and random edits of
+them are read both ways. For each text the scanner accepts, the node_stmt,
+edge_stmt, a_list and exit_graph calls it feeds to a reader must be the same
+as those of walking the ANTLR parse tree, and the text must parse without
+syntax errors. Texts the scanner rejects go to ANTLR anyway, so they are only
+counted. Needs the ANTLR runtime.
+
+Example:
+
+    benchmarks/check_scanner.py --files 200 --edits 20000
+    benchmarks/check_scanner.py -d /tmp/project/ --edits 0
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+from antlr4 import CommonTokenStream, InputStream, ParseTreeWalker
+from antlr4.error.ErrorListener import ErrorListener
+
+import DOTScanner
+from DOTDriver import DOTStatementListener
+from DOTLexer import DOTLexer
+from DOTParser import DOTParser
+
+import generate
+
+# Pieces of dot syntax inserted by the random edits
+PIECES = ['Node1', 'Node2', 'node', 'edge', 'graph', 'subgraph', 'strict',
+        ' ', '\t', '\n', '->', '--', '[', ']', '{', '}', ',', '=', ';', ':',
+        '"q"', '"a\\"b"', '"x\\<y"', '"a]b"', '"\\\\"', '"\\"', '0.2', '-3',
+        '.5', 'label', 'color', 'in', '/* c */', '// x\n', '#p']
+
+
+class Events:
+    """
+    Records the calls a DOTReader would get.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def node_stmt(self, node_id):
+        self.events.append(('node_stmt', node_id))
+
+    def edge_stmt(self, node1, node2):
+        self.events.append(('edge_stmt', node1, node2))
+
+    def a_list(self, keys, values):
+        self.events.append(('a_list', keys, values))
+
+    def exit_graph(self):
+        self.events.append(('exit_graph',))
+
+
+class SyntaxErrors(ErrorListener):
+
+    def __init__(self):
+        self.count = 0
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.count += 1
+
+
+def antlr_events(text):
+    """
+    Returns the calls of walking the ANTLR parse tree of text, or None if
+    text has syntax errors.
+    """
+    errors = SyntaxErrors()
+    lexer = DOTLexer(InputStream(text))
+    lexer.removeErrorListeners()
+    lexer.addErrorListener(errors)
+    parser = DOTParser(CommonTokenStream(lexer))
+    parser.removeErrorListeners()
+    parser.addErrorListener(errors)
+    tree = parser.graph()
+    if errors.count:
+        return None
+    events = Events()
+    ParseTreeWalker.DEFAULT.walk(DOTStatementListener(events), tree)
+    return events.events
+
+
+def scanner_events(text):
+    """
+    Returns the calls DOTScanner feeds for text, or None if it is not read.
+    """
+    statements = DOTScanner.scan(text)
+    if statements is None:
+        return None
+    events = Events()
+    DOTScanner.feed(statements, events)
+    return events.events
+
+
+def mutate(text, r, pieces=PIECES):
+    """
+    Returns text with one to three lines changed: a piece inserted, a
+    character removed or the line replaced with random pieces.
+    """
+    lines = text.split('\n')
+    for k in range(r.randint(1, 3)):
+        i = r.randrange(len(lines))
+        line = lines[i]
+        op = r.random()
+        if op < 0.4:
+            j = r.randint(0, len(line))
+            line = line[:j] + r.choice(pieces) + line[j:]
+        elif op < 0.7 and line:
+            j = r.randrange(len(line))
+            line = line[:j] + line[j + 1:]
+        else:
+            line = ''.join([r.choice(pieces)
+                for x in range(r.randint(1, 8))])
+        lines[i] = line
+    return '\n'.join(lines)
+
+
+def read_texts(directory, limit):
+    """
+    Returns the texts of up to limit dot files under directory.
+    """
+    texts = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.endswith('.dot') and len(texts) < limit:
+                with open(os.path.join(root, fname), 'r',
+                        encoding='ascii') as f:
+                    texts.append(f.read())
+    return texts
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    generate.add_arguments(p)
+    p.set_defaults(files=200)
+    p.add_argument('--directory', '-d', default='',
+            help='Check an existing Doxygen tree instead of a generated one.')
+    p.add_argument('--limit', type=int, default=1000,
+            help='Maximum number of files to read.')
+    p.add_argument('--edits', type=int, default=10000,
+            help='Number of randomly edited texts to check.')
+    args = p.parse_args(argv)
+
+    tmp = None
+    directory = args.directory
+    if directory == '':
+        tmp = tempfile.mkdtemp(prefix='dotcomb-check')
+        directory = tmp
+        generate.generate(directory, args.files, args.nodes_per_file,
+                args.depth, args.filter_hits, args.type, args.seed)
+    try:
+        texts = read_texts(directory, args.limit)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+    with open(os.path.join(BENCH_DIR, '..', 'test-file_cgraph.dot')) as f:
+        texts.append(f.read())
+
+    r = random.Random(args.seed)
+    scanned = rejected = mismatches = 0
+    for i in range(len(texts) + args.edits):
+        if i < len(texts):
+            text = texts[i]
+        else:
+            text = mutate(r.choice(texts), r)
+        events = scanner_events(text)
+        if events is None:
+            if i < len(texts):
+                print('Not read by the scanner: {!r}'.format(text[:200]))
+            rejected += 1
+            continue
+        scanned += 1
+        expected = antlr_events(text)
+        if events != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print('MISMATCH {!r}'.format(text))
+                print('  scanner: {}'.format(events))
+                print('  ANTLR:   {}'.format(expected))
+    print('{} texts read by the scanner, {} left to ANTLR, {} mismatches'
+            .format(scanned, rejected, mismatches))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+"""
+Generates a directory of synthetic Doxygen collaboration or call graphs.
+
+Every file describes one class and its neighbours the way Doxygen writes
+them. Neighbours are other generated classes, or with probability
+--filter-hits names that the default settings.yaml filters out.
+"""
+
+import argparse
+import os
+import random
+import sys
+
+PACKAGES = ['bdac', 'data', 'db', 'narrative', 'processor', 'utils', 'crypt',
+        'license', 'report', 'webapi', 'misc']
+
+# Labels filtered by FILTERED_RE_NODES or FILTERED_EXACT_NODES in the
+# default settings.yaml.
+FILTERED = ['String', 'int', 'Thread', 'Object', 'File', 'ExecutorService',
+        'org.sevenzip.Archive', 'Runnable', 'Socket', 'UUID']
+
+HEADER = '''digraph "{label}"
+{{
+  edge [fontname="Helvetica",fontsize="10",labelfontname="Helvetica",labelfontsize="10"];
+  node [fontname="Helvetica",fontsize="10",shape=record];
+  rankdir="LR";
+'''
+NODE = ('  Node{id} [label="{label}",height=0.2,width=0.4,color="black", '
+        'fillcolor="{fill}", style="filled"{url}];\n')
+COLL_EDGE = ('  Node{n1} -> Node{n2} [dir="back",color="darkorchid3",fontsize="10",'
+        'style="dashed",label=" m_{name}" ,fontname="Helvetica"];\n')
+INHERIT_EDGE = ('  Node{n1} -> Node{n2} [dir="back",color="midnightblue",fontsize="10",'
+        'style="solid",fontname="Helvetica"];\n')
+CALL_EDGE = ('  Node{n1} -> Node{n2} [color="midnightblue",fontsize="10",'
+        'style="solid",fontname="Helvetica"];\n')
+
+
+def class_labels(count, depth, r):
+    """
+    Returns count class names with depth components, e.g.
+    com.cardiscope.data.C12 for depth 4.
+    """
+    labels = []
+    for i in range(count):
+        parts = ['com', 'cardiscope', r.choice(PACKAGES)]
+        while len(parts) < depth - 1:
+            parts.append('sub{}'.format(r.randrange(5)))
+        labels.append('.'.join(parts[:max(depth - 1, 1)] + ['C{}'.format(i)]))
+    return labels
+
+
+def file_name(label, graph_type):
+    name = 'class' + label.replace('.', '_1_1')
+    if graph_type == 'call_graph':
+        return name + '_a1b2c3_cgraph.dot'
+    return name + '__coll__graph.dot'
+
+
+def graph_text(label, neighbours, graph_type, r):
+    text = [HEADER.format(label=label)]
+    text.append(NODE.format(id=1, label=label, fill='grey75', url=''))
+    for i, neighbour in enumerate(neighbours, 2):
+        if graph_type == 'call_graph':
+            text.append(CALL_EDGE.format(n1=1, n2=i))
+        elif r.random() < 0.7:
+            text.append(COLL_EDGE.format(n1=i, n2=1, name=neighbour.split('.')[-1]))
+        else:
+            text.append(INHERIT_EDGE.format(n1=i, n2=1))
+        url = ',URL="$class{}.html"'.format(i)
+        text.append(NODE.format(id=i, label=neighbour, fill='white', url=url))
+    text.append('}\n')
+    return ''.join(text)
+
+
+def generate(directory, files, nodes_per_file=8, depth=4, filter_hits=0.1,
+        graph_type='collab', seed=1):
+    """
+    Writes files dot files under directory, spread over subdirectories like
+    Doxygen's CREATE_SUBDIRS does. Returns the number of edges written.
+    """
+    r = random.Random(seed)
+    labels = class_labels(files, depth, r)
+    edges = 0
+    for i, label in enumerate(labels):
+        neighbours = []
+        for j in range(r.randint(0, 2 * (nodes_per_file - 1))):
+            if r.random() < filter_hits:
+                neighbours.append(r.choice(FILTERED))
+            else:
+                neighbours.append(r.choice(labels))
+        subdir = os.path.join(directory, 'd{}'.format(i % 16), 'd{}'.format(i % 7))
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, file_name(label, graph_type)), 'w') as f:
+            f.write(graph_text(label, neighbours, graph_type, r))
+        edges += len(neighbours)
+    return edges
+
+
+def add_arguments(p):
+    p.add_argument('--files', '-n', type=int, default=1000,
+            help='Number of dot files.')
+    p.add_argument('--nodes-per-file', type=int, default=8,
+            help='Average number of nodes per file.')
+    p.add_argument('--depth', type=int, default=4,
+            help='Number of components in class labels.')
+    p.add_argument('--filter-hits', type=float, default=0.1,
+            help='Share of neighbours that are filtered out with -f.')
+    p.add_argument('--type', '-t', choices=['collab', 'call_graph'],
+            default='collab')
+    p.add_argument('--seed', type=int, default=1)
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    p.add_argument('directory')
+    add_arguments(p)
+    args = p.parse_args(argv)
+    edges = generate(args.directory, args.files, args.nodes_per_file,
+            args.depth, args.filter_hits, args.type, args.seed)
+    print('Wrote {} files with {} edges to {}'.format(args.files, edges,
+        args.directory))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
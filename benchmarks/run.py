@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+"""
+Benchmarks every stage of dotcomb on a synthetic Doxygen tree.
+
+The stages are timed separately: discovery, parsing (DOTScanner or ANTLR),
+DOTReader extraction, merging into the combined graph, filtering, cleanup and
+output. Results can be saved as a baseline and later runs compared against
+it; a stage that is slower than the baseline by more than --tolerance makes
+the run fail, so this can be used to catch regressions in CI.
+
+Example:
+
+    benchmarks/run.py --files 20000 --save-baseline baseline.json
+    benchmarks/run.py --files 20000 --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+import yaml
+import dotcomb
+from DOTFilter import DOTFilter
+from DOTGraph import StreamingGraph
+from DOTPackage import PackageResolver
+from DOTStats import DOTStats
+
+import generate
+
+STAGES = ['discover', 'parse', 'extract', 'merge', 'filter', 'cleanup',
+        'output']
+# Names of the stages in DOTStats where they differ
+STAT_STAGES = {'output': 'write'}
+
+
+def run_stages(directory, argv, settings):
+    """
+    Runs the pipeline of dotcomb.main with the stages timed by DOTStats, so
+    that the options in argv (-j, --streaming, --merge, ...) are used as in
+    a real run. Returns the time of each stage and the counts
+    used for throughput. With -j the parse and extract times are those of
+    the parser processes added up.
+    """
+    params = dotcomb.read_params(argv + ['-d', directory])
+    dotcomb.params = params
+    dotcomb.settings = settings
+    dotcomb.node_filter = DOTFilter(settings, params['filter'] is True)
+    dotcomb.packages = PackageResolver(settings)
+    stats = DOTStats()
+
+    if params['streaming']:
+        graphs = [StreamingGraph(params['bidir'], params['spill_edges'])
+                for p in dotcomb.level_params()]
+    else:
+        graphs = [dotcomb.graph_type()(params['bidir'])
+                for p in dotcomb.level_params()]
+    dotcomb.read_files(stats.timed(dotcomb.discover_files(), 'discover'),
+            graphs, None, stats)
+    for graph in graphs:
+        with open(os.devnull, dotcomb.output_mode()) as f:
+            if params['streaming']:
+                dotcomb.write_streaming(graph, dotcomb.make_writer(), f,
+                        stats)
+            else:
+                dotcomb.write_graph(graph, dotcomb.make_writer(), f, stats)
+
+    times = {stage: stats.wall.get(STAT_STAGES.get(stage, stage), 0.0)
+            for stage in STAGES}
+    counts = {
+        'files': stats.counters.get('files', 0),
+        'edges': stats.counters.get('edges_read', 0),
+        'merged_edges': stats.counters.get('edges_merged',
+            stats.counters.get('edges_written', 0)),
+        'output_edges': stats.counters.get('edges_written', 0),
+    }
+    return times, counts
+
+
+def throughput(stage, seconds, counts):
+    if seconds == 0:
+        return ''
+    if stage in ('discover', 'parse', 'extract'):
+        return '{:12.0f} files/s'.format(counts['files'] / seconds)
+    if stage == 'merge':
+        return '{:12.0f} edges/s'.format(counts['edges'] / seconds)
+    if stage == 'output':
+        return '{:12.0f} edges/s'.format(counts['output_edges'] / seconds)
+    return '{:12.0f} edges/s'.format(counts['merged_edges'] / seconds)
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    generate.add_arguments(p)
+    p.add_argument('--directory', '-d', default='',
+            help='Benchmark an existing Doxygen tree instead of a generated one.')
+    p.add_argument('--args', default='-f',
+            help='dotcomb command-line options to benchmark with.')
+    p.add_argument('--settings', default=os.path.join(BENCH_DIR, '..',
+            'settings.yaml'))
+    p.add_argument('--repeat', type=int, default=3,
+            help='Number of runs; the fastest time of each stage is used.')
+    p.add_argument('--baseline', default='',
+            help='Compare against results saved with --save-baseline.')
+    p.add_argument('--save-baseline', default='')
+    p.add_argument('--tolerance', type=float, default=0.2,
+            help='Allowed slowdown compared to the baseline (0.2 = 20%%).')
+    p.add_argument('--min-seconds', type=float, default=0.05,
+            help='Slowdowns smaller than this are not regressions.')
+    args = p.parse_args(argv)
+
+    with open(args.settings) as f:
+        settings = yaml.safe_load(f)
+
+    tmp = None
+    directory = args.directory
+    if directory == '':
+        tmp = tempfile.mkdtemp(prefix='dotcomb-bench')
+        directory = tmp
+        generate.generate(directory, args.files, args.nodes_per_file,
+                args.depth, args.filter_hits, args.type, args.seed)
+    try:
+        best = None
+        for i in range(args.repeat):
+            times, counts = run_stages(directory, args.args.split() +
+                    ['-t', args.type], settings)
+            if best is None:
+                best = times
+            else:
+                best = {s: min(best[s], times[s]) for s in STAGES}
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+
+    baseline = {}
+    if args.baseline != '':
+        with open(args.baseline) as f:
+            baseline = json.load(f)['times']
+
+    print('{} files, {} edges read, {} merged, {} written'.format(
+        counts['files'], counts['edges'], counts['merged_edges'],
+        counts['output_edges']))
+    regressions = []
+    for stage in STAGES + ['total']:
+        seconds = sum(best.values()) if stage == 'total' else best[stage]
+        line = '{:10} {:9.3f} s {:20}'.format(stage, seconds,
+                '' if stage == 'total' else throughput(stage, seconds, counts))
+        if stage in baseline and baseline[stage] > 0:
+            ratio = seconds / baseline[stage]
+            line += ' {:6.2f}x baseline'.format(ratio)
+            if (ratio > 1 + args.tolerance and stage != 'total' and
+                    seconds - baseline[stage] > args.min_seconds):
+                line += '  REGRESSION'
+                regressions.append(stage)
+        print(line)
+
+    if args.save_baseline != '':
+        best['total'] = sum(best.values())
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'counts': counts, 'times': best}, f, indent=2,
+                    sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+"""
+Benchmarks the startup time of dotcomb.
+
+Times dotcomb.py -h and a whole run on a directory with a single dot file
+(time to first file), each in a new Python process like scripts run it. The
+median of --repeat runs is reported, along with the startup time of Python
+itself for reference. As with run.py, results can be saved as a baseline and
+later runs compared against it.
+
+Example:
+
+    benchmarks/startup.py --save-baseline startup.json
+    benchmarks/startup.py --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, '..')
+DOTCOMB = os.path.abspath(os.path.join(ROOT_DIR, 'dotcomb.py'))
+
+import generate
+
+CASES = ['help', 'first_file']
+
+
+def time_command(args, repeat, cwd):
+    """
+    Returns the median wall time of running python with args in cwd.
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=cwd,
+                stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(argv):
+    p = argparse.ArgumentParser()
+    p.add_argument('--repeat', type=int, default=10)
+    p.add_argument('--baseline', default='',
+            help='Compare against results saved with --save-baseline.')
+    p.add_argument('--save-baseline', default='')
+    p.add_argument('--tolerance', type=float, default=0.2,
+            help='Allowed slowdown compared to the baseline (0.2 = 20%%).')
+    args = p.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix='dotcomb-startup')
+    try:
+        data = os.path.join(tmp, 'data')
+        generate.generate(data, 1)
+        # dotcomb.py writes dotcomb.log and reads settings.yaml in the
+        # current directory
+        shutil.copy(os.path.join(ROOT_DIR, 'settings.yaml'), tmp)
+        times = {
+            'help': time_command([DOTCOMB, '-h'], args.repeat, tmp),
+            'first_file': time_command([DOTCOMB, '-f', '-d', data, '-o',
+                os.path.join(tmp, 'out.dot')], args.repeat, tmp),
+        }
+        python = time_command(['-c', 'pass'], args.repeat, tmp)
+    finally:
+        shutil.rmtree(tmp)
+
+    baseline = {}
+    if args.baseline != '':
+        with open(args.baseline) as f:
+            baseline = json.load(f)['times']
+
+    print('{:10} {:9.3f} s (Python itself)'.format('python', python))
+    regressions = []
+    for case in CASES:
+        line = '{:10} {:9.3f} s'.format(case, times[case])
+        if case in baseline and baseline[case] > 0:
+            ratio = times[case] / baseline[case]
+            line += ' {:6.2f}x baseline'.format(ratio)
+            if ratio > 1 + args.tolerance:
+                line += '  REGRESSION'
+                regressions.append(case)
+        print(line)
+
+    if args.save_baseline != '':
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'times': times}, f, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,26 +1,42 @@
 #!/usr/bin/python3
 
 import sys
-import glob
+import fnmatch
 import re
-#import pprint
-from collections import namedtuple
 import argparse
-import itertools
-import yaml
-from DOTReader import *
-from DOTLexer import DOTLexer
-from DOTParser import DOTParser
+from DOTReader import DOTReader
+from DOTGraph import DOTGraph, BatchGraph, EdgeIndex, StreamingGraph, SPILL_EDGES
+from DOTFilter import DOTFilter
+from DOTPackage import PackageResolver
+from DOTWriter import DOTWriter, BUFFER_SIZE
+from DOTStats import DOTStats
+from DOTWatcher import DOTWatcher
+import DOTScanner
+import DOTCombiner
 import logging
-import pprint
+import os
+import time
+# yaml, multiprocessing, DOTCache, DOTProfile, DOTFormats, DOTReduce and
+# DOTDriver (which loads the ANTLR runtime) are imported where they are first
+# needed, to keep startup fast.
 
 params = {}
 
-file_mappings = {}
+# Number of files sent to a parser process at a time.
+CHUNK_SIZE = 64
+
+# Output formats, and those written to a binary file
+FORMATS = ['dot', 'json', 'graphml', 'npz']
+BINARY_FORMATS = ['npz']
+
 settings_file = 'settings.yaml'
 settings = {}
-printer = None
-cluster = 0
+antlr_driver = None
+node_filter = None
+packages = None
+profiler = None
+shard_items = []
+provenance = None # DOTStore.Provenance of each level with --store
 
 
 def read_params(args):
@@ -29,6 +45,10 @@ def read_params(args):
     p.add_argument('--filter', '-f', help='Filter graph.', action='store_true',
             default=False)
     p.add_argument('--level', '-l', help='Graph level', type=int, default=4)
+    p.add_argument('--levels', help='Write a graph for each of these comma '
+            'separated levels, e.g. 3,4,0, while reading the files only once. '
+            'The level is added to the output file name before its extension, '
+            'or replaces {level} in it.', default='')
     p.add_argument('--bidir', '-b', help='Non-directional graph',
             action='store_true', default=False)
     p.add_argument('--type', '-t', help='Type of graph', choices=['collab',
@@ -37,28 +57,127 @@ def read_params(args):
             action='store_true', default=False)
     p.add_argument('--directory', '-d', help='Work directory.',
             default='/tmp/');
+    p.add_argument('--files-from', help='Read the dot files listed in this '
+            'file (- for stdin) instead of searching the work directory.',
+            default='')
+    p.add_argument('--exclude', help='Do not search directories with names '
+            'matching this pattern. Can be given several times.',
+            action='append', default=[])
+    p.add_argument('--max-depth', help='Search at most this many directory '
+            'levels below the work directory. -1 means no limit.', type=int,
+            default=-1)
     p.add_argument('--output', '-o', help='Output file name. Default stdout.',
             default='')
     p.add_argument('--header', help='Graph title', default='')
+    p.add_argument('--focus', help='Only write the nodes within --hops of '
+            'these comma separated labels, which can have wildcards (*).',
+            default='')
+    p.add_argument('--hops', help='Number of edges to follow from the '
+            '--focus nodes. -1 means no limit.', type=int, default=1)
+    p.add_argument('--direction', help='Follow edges out of the --focus nodes, '
+            'into them or both.', choices=['in', 'out', 'both'],
+            default='both')
+    p.add_argument('--reduce', help='Remove the edges implied by longer '
+            'paths (transitive reduction) before writing.',
+            choices=['none', 'transitive'], default='none')
+    p.add_argument('--shard-by', help='Write a file for each package, next to '
+            'the output file, and an overview graph of the edges between '
+            'packages to the output file.', choices=['none', 'cluster'],
+            default='none')
+    p.add_argument('--store', help='Save the nodes and edges, with their '
+            'packages and the files they came from, to this SQLite database '
+            'for dotcomb.py query.', default='')
+    p.add_argument('--format', help='Output format. npz needs numpy and an '
+            'output file.', choices=FORMATS, default='dot')
     p.add_argument('--settings', '-s', help='Alternative settings file',
             default='')
-    return vars(p.parse_args(args))
+    p.add_argument('--cache', help='Cache parsed dot files in this file so '
+            'that unchanged files are not parsed again.', default='')
+    p.add_argument('--buffer-size', help='Size of the chunks written to the '
+            'output file.', type=int, default=BUFFER_SIZE)
+    p.add_argument('--streaming', help='Keep the graph in compact form and '
+            'move edges to disk when there are many of them.',
+            action='store_true', default=False)
+    p.add_argument('--spill-edges', help='Number of edges kept in memory '
+            'with --streaming.', type=int, default=SPILL_EDGES)
+    p.add_argument('--merge', help='Merge the edges of each file as it is '
+            'read, or collect them and merge them in batches with NumPy.',
+            choices=['incremental', 'batch'], default='incremental')
+    p.add_argument('--jobs', '-j', help='Number of parallel parser processes. '
+            '0 uses all CPUs.', type=int, default=1)
+    p.add_argument('--watch', help='Keep running and rewrite the output file '
+            'when dot files are added, changed or removed.',
+            action='store_true', default=False)
+    p.add_argument('--interval', help='Seconds between checks for changed '
+            'files with --watch.', type=float, default=1.0)
+    p.add_argument('--stats', help='Write statistics of the run to this file.',
+            default='')
+    p.add_argument('--stats-format', help='Format of the --stats file.',
+            choices=['json', 'prometheus'], default='json')
+    p.add_argument('--verbose', '-v', help='Log every node and edge to '
+            'dotcomb.log.', action='store_true', default=False)
+    p.add_argument('--profile', help='Save profiles and memory snapshots of '
+            'each stage and a report of the slowest and largest files to '
+            'this directory.', default='')
+    p.add_argument('--profile-top', help='Number of files, functions and '
+            'allocations listed in the --profile report.', type=int,
+            default=20)
+    params = vars(p.parse_args(args))
+    try:
+        params['levels'] = [int(x) for x in params['levels'].split(',')
+                if x.strip() != '']
+    except ValueError:
+        p.error('--levels must be comma separated numbers')
+    if params['levels'] and params['output'] == '':
+        p.error('--levels needs an output file (-o)')
+    if params['levels'] and params['watch']:
+        p.error('--levels can not be used with --watch')
+    if params['watch'] and params['output'] == '':
+        p.error('--watch needs an output file (-o)')
+    if params['watch'] and params['streaming']:
+        p.error('--watch can not be used with --streaming')
+    if params['watch'] and params['profile'] != '':
+        p.error('--watch can not be used with --profile')
+    if params['reduce'] != 'none' and params['streaming']:
+        p.error('--reduce can not be used with --streaming')
+    if params['focus'] != '' and params['streaming']:
+        p.error('--focus can not be used with --streaming')
+    if params['shard_by'] != 'none':
+        if params['output'] == '':
+            p.error('--shard-by needs an output file (-o)')
+        if params['streaming'] or params['watch']:
+            p.error('--shard-by can not be used with --streaming or --watch')
+    if params['store'] != '' and (params['streaming'] or params['watch']):
+        p.error('--store can not be used with --streaming or --watch')
+    if params['format'] in BINARY_FORMATS and params['output'] == '':
+        p.error('--format {} needs an output file (-o)'.format(params['format']))
+    if params['merge'] == 'batch' and params['streaming']:
+        p.error('--merge batch can not be used with --streaming')
+    numpy_options = [option for option, used in (
+        ('--format npz', params['format'] == 'npz'),
+        ('--merge batch', params['merge'] == 'batch')) if used]
+    if numpy_options:
+        import importlib.util
+        if importlib.util.find_spec('numpy') is None:
+            p.error('{} needs numpy'.format(numpy_options[0]))
+    return params
 
 
 def show_node(node_label):
     """
-    Checks whether given node should be shown in the graph. Nodes are filtered
-    with FILTERED_RE_NODES (regular expression matching) and
+    Checks whether given node should be shown in the cleaned up graph. Nodes
+    are filtered with FILTERED_RE_NODES (substring matching) and
     FILTERED_EXACT_NODES (exact string match).
     """
-    if params['filter'] is True:
-        if len([x for x in settings['FILTERED_RE_NODES'] if node_label.find(x) != -1]) > 0:
-            return False
-        if node_label.replace('"', '') in settings['FILTERED_EXACT_NODES']:
-            return False
-        return True
-    else:
-        return True
+    return node_filter.show_cleaned(node_label)
+
+
+def pkg_name(x):
+    """
+    Returns matching clustering value or empty string is string doesn't
+    match pattern.
+    """
+    return packages.pkg_name(x)
 
 
 def set_params(node):
@@ -78,175 +197,802 @@ def set_params(node):
             found = True
     if found == False:
         node['color'] = settings['PACKAGE_COLORS']['other']
-    group = pkg_name(node['label'])
+    group = pkg
     if group != '':
         node['group'] = group.replace('.', '')
 
 
-def has_edges(node_label, edges):
+def file_pattern(graph_type):
+    """
+    Returns the file name pattern of dot files of the given type (collab or
+    call_graph).
+    """
+    if graph_type == 'call_graph':
+        return '*_cgraph*.dot'
+    elif graph_type == 'collab':
+        return '*__coll*.dot'
+
+
+def iter_files(directory, graph_type, exclude=(), max_depth=-1):
+    """
+    Yields the dot files of the given type under directory as they are
+    found. Directories whose name matches one of the exclude patterns are
+    not entered, nor directories more than max_depth levels below directory
+    (-1 means no limit). The files come in the same order as from
+    glob.glob(directory + '/**/' + pattern, recursive=True), which decides
+    the output when files define the same nodes.
+    """
+    name_re = re.compile(fnmatch.translate(file_pattern(graph_type)))
+    exclude_re = None
+    if exclude:
+        exclude_re = re.compile('|'.join([fnmatch.translate(x) for x in exclude]))
+    top = directory.rstrip('/') or '/'
+    yield from _walk(top, name_re, exclude_re, max_depth)
+
+
+def _walk(directory, name_re, exclude_re, depth):
+    """
+    Yields the matching files of directory and then recurses into its
+    subdirectories, skipping hidden entries like glob does.
+    """
+    try:
+        with os.scandir(directory) as it:
+            entries = [entry for entry in it if entry.name[0] != '.']
+    except OSError as e:
+        logging.warning('Can not read %s: %s', directory, e)
+        return
+    for entry in entries:
+        if name_re.match(entry.name):
+            yield entry.path
+    if depth == 0:
+        return
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            continue
+        if is_dir and not (exclude_re and exclude_re.match(entry.name)):
+            yield from _walk(entry.path, name_re, exclude_re, depth - 1)
+
+
+def read_file_list(name):
+    """
+    Yields the file names listed one per line in file name, or in stdin if
+    name is -.
+    """
+    f = sys.stdin if name == '-' else open(name, 'r')
+    try:
+        for line in f:
+            fname = line.strip()
+            if fname != '':
+                yield fname
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def discover_files():
+    """
+    Yields the dot files given with --files-from or found under --directory.
+    """
+    if params['files_from'] != '':
+        return read_file_list(params['files_from'])
+    return iter_files(params['directory'], params['type'], params['exclude'],
+            params['max_depth'])
+
+
+def filter_edges(graph):
+    """
+    Returns the edges of a DOTGraph whose both ends are shown nodes, and an
+    EdgeIndex of them.
+    """
+    return DOTCombiner.filter_edges(graph, show_node)
+
+
+def clean_nodes(nodes, index):
     """
-    Checks if given node name has any edges. Nodes with no edges are not added
-    to the graph.
+    Returns the nodes that have edges in the EdgeIndex.
     """
-    return len([
-        k for k in edges.keys() if k[0] == node_label or k[1] == node_label]) > 0
+    return DOTCombiner.clean_nodes(nodes, index)
 
 
-def print_node(key, node, edges, f):
+def read_statements(fname):
+    """
+    Reads the statements of a single dot file. Files in the Doxygen dialect
+    are read with DOTScanner, anything else with the ANTLR parser.
     """
-    Prints a single node.
+    with open(fname, 'r', encoding='ascii') as f:
+        statements = DOTScanner.scan(f.read())
+    if statements is not None:
+        return statements
+    logging.info('%s: not in Doxygen dialect, using ANTLR parser', fname)
+    global antlr_driver
+    if antlr_driver is None:
+        from DOTDriver import DOTDriver
+        antlr_driver = DOTDriver()
+    return antlr_driver.read(fname)
+
+
+def init_worker(worker_settings, worker_params):
     """
-    if has_edges(key, edges):
-        print("\t{}\n\t\t[{}];\n".format(key, ',\n\t\t'.join([key+'='+v for
-            key,v in sorted(node[1].items())])), file = f)
+    Sets up the globals of a parser process.
+    """
+    global params
+    global settings
+    global node_filter
+    global packages
+    global profiler
+    if profiler is not None:
+        # Forked from a run with --profile; parser processes are not profiled.
+        profiler.stop()
+        profiler = None
+    settings = worker_settings
+    params = worker_params
+    node_filter = DOTFilter(settings, params['filter'] is True)
+    packages = PackageResolver(settings)
+
+
+def parse_file(item):
+    """
+    Parses a single dot file, in a worker process with --jobs. item is the
+    file name and its cached statements or None. Returns only the nodes,
+    edges and ignored nodes found in this file so that the parent can merge
+    them in file order, the statements if they were parsed and need to be
+    cached, and the wall and CPU times of parsing and extraction.
+    """
+    fname, statements = item
+    file_stats = DOTStats()
+    file_stats.profiler = profiler
+    parsed = statements is None
+    if parsed:
+        with file_stats.timer('parse'):
+            statements = read_statements(fname)
+    results = []
+    with file_stats.timer('extract'):
+        for p in level_params():
+            printer = DOTReader(settings, p, node_filter=node_filter,
+                    packages=packages)
+            DOTScanner.feed(statements, printer)
+            results.append((printer.nodes, printer.file_edges,
+                printer.ignored_nodes))
+    if not parsed or params['cache'] == '':
+        statements = None
+    return (fname, statements, results, (file_stats.wall, file_stats.cpu))
+
+
+def level_params():
+    """
+    Returns the params for reading each level of --levels, or just params.
+    """
+    if not params['levels']:
+        return [params]
+    return [dict(params, level=level) for level in params['levels']]
+
+
+def log_file(fname, nodes, edges, ignored):
+    logging.info('%s:\n\t\t nodes %s, edges %s, ignored: %s',
+            fname.split('/')[5:], nodes, edges, ignored)
 
 
-def print_subgraph(k, g, edges, f):
+def lookup_files(files, cache, stats):
     """
-    Prints subgraph info if -c command-line parameter was supplied, otherwise
-    just prints each node in a group at once.
+    Yields each file name with its statements from the cache, or None if
+    the file has to be parsed.
     """
-    global cluster
-    if params['cluster']:
-        print('\tsubgraph cluster_{} {{'.format(cluster), file = f)
-        if len(k) > 0:
-            print('\t\tlabel={};'.format(k), file = f)
-            print('\t\tfontsize=48;', file = f)
+    for fname in files:
+        if cache is None:
+            yield fname, None
         else:
-            print('\t\tlabel=\"\";', file = f)
-    for node in g:
-        print_node(node[0], node, edges, f)
-    if params['cluster']:
-        print('\t}', file = f)
-        cluster = cluster + 1
+            with stats.timer('cache'):
+                statements = cache.get(fname)
+            yield fname, statements
 
 
-def sort_func(x):
+def merge_results(results, graphs, cache, stats):
+    """
+    Merges the results of parse_file() into the graph of each level in the
+    order they come.
     """
-    Return package name if clustering is defined, otherwise label name in lower case
+    for fname, statements, levels, times in results:
+        stats.add_times(*times)
+        with stats.timer('merge'):
+            for graph, (nodes, edges, ignored) in zip(graphs, levels):
+                graph.add_file(nodes, edges, ignored)
+        if provenance is not None:
+            for p, (nodes, edges, ignored) in zip(provenance, levels):
+                p.add(fname, nodes, edges)
+        nodes, edges, ignored = levels[0]
+        if statements is not None:
+            cache.put(fname, statements)
+        stats.count('files')
+        stats.count('nodes_read', len(nodes))
+        stats.count('edges_read', len(edges))
+        if profiler is not None:
+            profiler.add_file(fname, times[0].get('parse', 0.0), len(nodes),
+                    len(edges))
+        log_file(fname, len(nodes), len(edges), len(ignored))
+
+
+def read_files(files, graphs, cache=None, stats=None):
     """
-    if params['cluster'] is True:
-        return pkg_name(x[0].lower())
+    Reads all files into graphs, one for each level of --levels or just one,
+    either serially or with a pool of parser processes (--jobs). files can
+    be any iterable; parsing starts as soon as the first file is known.
+    Files found in the cache are not parsed again.
+    Results are merged in file order so the output is the same regardless of
+    the number of jobs.
+    """
+    if stats is None:
+        stats = DOTStats()
+    items = lookup_files(files, cache, stats)
+    jobs = params['jobs'] or os.cpu_count()
+    if jobs > 1:
+        import multiprocessing
+        with multiprocessing.Pool(jobs, init_worker,
+                (settings, params)) as pool:
+            # The pool reads the files from another thread.
+            merge_results(pool.imap(parse_file, items, CHUNK_SIZE), graphs,
+                    cache, stats)
     else:
-        return x[0].lower()
+        merge_results(map(parse_file, items), graphs, cache, stats)
+    if params['merge'] == 'batch':
+        with stats.timer('merge'):
+            for graph in graphs:
+                graph.consolidate()
 
 
-def print_nodes(nodes, edges, f):
+def read_file_results(files, cache=None):
+    """
+    Reads files one by one and yields (fname, nodes, edges, ignored nodes)
+    of each, in file order. Unlike read_files() the results of different
+    files are kept apart, which --watch needs to retract a file later. Files
+    that can't be read are skipped.
     """
-    Prints all nodes sorted by group.
+    cached = {}
+    if cache is not None:
+        for fname in files:
+            try:
+                statements = cache.get(fname)
+            except OSError:
+                continue
+            if statements is not None:
+                cached[fname] = statements
+    missing = [fname for fname in files if not fname in cached]
+
+    jobs = params['jobs'] or os.cpu_count()
+    if jobs > 1 and len(missing) > 1:
+        import multiprocessing
+        chunksize = max(1, len(missing) // (jobs * 16))
+        with multiprocessing.Pool(jobs, init_worker,
+                (settings, params)) as pool:
+            parsed = {}
+            for fname, statements, levels, times in pool.imap(
+                    _parse_file, missing, chunksize):
+                if levels is None:
+                    parsed[fname] = None
+                    continue
+                if cache is not None:
+                    cache.put(fname, statements)
+                parsed[fname] = levels[0]
+    else:
+        parsed = None
+    for fname in files:
+        if parsed is not None and fname in parsed:
+            result = parsed.pop(fname)
+            if result is not None:
+                yield (fname,) + result
+            continue
+        statements = cached.pop(fname, None)
+        if statements is None:
+            try:
+                statements = read_statements(fname)
+            except OSError as e:
+                logging.warning('Skipping %s: %s', fname, e)
+                continue
+            if cache is not None:
+                cache.put(fname, statements)
+        reader = DOTReader(settings, params, node_filter=node_filter,
+                packages=packages)
+        DOTScanner.feed(statements, reader)
+        yield (fname, reader.nodes, reader.file_edges,
+                reader.ignored_nodes)
+
+
+def _parse_file(fname):
     """
-    sorted_nodes = [d for d in nodes.items()]
-    sorted_nodes.sort(key=sort_func)
-    for k,v in itertools.groupby(sorted_nodes, sort_func):
-        print_subgraph(k,list(v), edges, f)
+    parse_file() for read_file_results(), which returns None as the results
+    of a file that can't be read.
+    """
+    try:
+        return parse_file((fname, None))
+    except OSError as e:
+        logging.warning('Skipping %s: %s', fname, e)
+        return fname, None, None, None
 
 
-def print_edges(edges, f):
+def graph_type():
     """
-    Prints all edges.
+    Returns the class of the combined graph for --merge.
     """
-    arrow = '->'
-    # Remove quotes and convert to lower case for a more logical order
-    sorted_edges = sorted(edges.items(), key=lambda k: (k[0][0]+k[0][1]).replace('"', '').lower())
-    for k, v in sorted_edges:
-        sorted_values = sorted(v.items())
-        print("\t{} {} {}\n\t\t[{}];\n".format(k[0], arrow, k[1], ',\n\t\t'.join([k+'='+v2 for
-            k,v2 in sorted_values])), file=f)
+    return BatchGraph if params['merge'] == 'batch' else DOTGraph
 
 
-def print_legend(components, f):
-    print('\t{ rank=same; 0 [style=invis] }'
-                '\n\tedge [style=invis];'
-                '\n\tfontcolor=black;\n', file = f)
-    nodes = '->'.join(sorted(components)).replace('.', '')
-    print('\t{};'.format(nodes), file = f)
-    for c in sorted(components):
-        component = c.replace('.', '')
-        print('\t{} [label={}, color={}, style=filled, fontsize=24];'
-                .format(component, component, components[c]), file = f)
+def make_writer(writer_settings=None):
+    """
+    Returns the writer for --format. writer_settings replaces the settings.
+    """
+    if writer_settings is None:
+        writer_settings = settings
+    if params['format'] == 'dot':
+        return DOTWriter(writer_settings, params, packages)
+    from DOTFormats import WRITERS
+    return WRITERS[params['format']](writer_settings, params, packages)
+
+
+def output_mode():
+    """
+    Returns the mode to open the output file with.
+    """
+    return 'wb' if params['format'] in BINARY_FORMATS else 'w'
+
+
+def focus(nodes, index, edges):
+    """
+    Returns the nodes, EdgeIndex and edges within --hops of the nodes
+    matching --focus.
+    """
+    patterns = [x.strip() for x in params['focus'].split(',') if x.strip()]
+    focused_nodes, focused_index, focused_edges, found = \
+            DOTCombiner.focus_graph(nodes, index, edges, patterns,
+                    params['hops'], params['direction'])
+    if not found:
+        logging.warning('No nodes match --focus %s', params['focus'])
+    logging.info('Focus on %s nodes: %s nodes and %s edges within %s hops',
+            found, len(focused_nodes), len(focused_edges), params['hops'])
+    return focused_nodes, focused_index, focused_edges
+
+
+def clean_graph(graph, stats):
+    """
+    Filters and cleans up the combined graph, and picks the --focus nodes and
+    reduces it with --reduce.
+    Returns the nodes, the EdgeIndex and the edges to write.
+    """
+    nodes = graph.nodes
+    ignored_nodes = graph.ignored_nodes
+    with stats.timer('filter'):
+        cleaned_edges, cleaned_index = filter_edges(graph)
+    with stats.timer('cleanup'):
+        cleaned_nodes = clean_nodes(nodes, cleaned_index)
+    if params['focus'] != '':
+        with stats.timer('focus'):
+            cleaned_nodes, cleaned_index, cleaned_edges = focus(cleaned_nodes,
+                    cleaned_index, cleaned_edges)
+    if params['reduce'] == 'transitive':
+        with stats.timer('reduce'):
+            removed = DOTCombiner.reduce_edges(cleaned_edges, cleaned_index)
+        logging.info('Transitive reduction removed %s of %s edges',
+                removed, len(cleaned_edges) + removed)
+        stats.count('edges_reduced', removed)
+
+    # Print some info to log
+    logging.info('Nodes: %s, edges: %s', len(cleaned_nodes), len(cleaned_edges))
+    logging.info('Filter list: %s', settings['FILTERED_EXACT_NODES'])
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        l = sorted(list(cleaned_nodes.keys()))
+        logging.debug('Node list: %s', '\n\t'.join(l))
+        l = sorted(list(ignored_nodes.keys()))
+        logging.debug('Ignored nodes: %s', '\n\t'.join(l))
+    stats.count('nodes_merged', len(nodes))
+    stats.count('edges_merged', len(graph.edges))
+    stats.count('ignored_nodes', len(ignored_nodes))
+    stats.count('nodes_written', len(cleaned_nodes))
+    stats.count('edges_written', len(cleaned_edges))
+    return cleaned_nodes, cleaned_index, cleaned_edges
+
+
+def write_graph(graph, writer, f, stats):
+    """
+    Cleans up the combined graph and writes it to f.
+    """
+    cleaned_nodes, cleaned_index, cleaned_edges = clean_graph(graph, stats)
+    with stats.timer('write'):
+        writer.write(f, cleaned_nodes, cleaned_index, cleaned_edges,
+                params['buffer_size'])
+    return cleaned_nodes, cleaned_index, cleaned_edges
+
+
+def write_shards(graph, f, output, stats):
+    """
+    Cleans up the combined graph and writes the nodes of each package and
+    their edges to a file named after output, in parallel with --jobs, and
+    the overview graph of the packages to f. Returns the cleaned up graph
+    like write_graph().
+    """
+    import DOTShard
+    nodes, index, edges = clean_graph(graph, stats)
+    with stats.timer('shard'):
+        shards, between = DOTShard.split(nodes, edges,
+                lambda x: packages.pkg_name(x.lower()))
+    root, ext = os.path.splitext(output)
+    items = [('{}.{}{}'.format(root, DOTShard.shard_name(pkg), ext),
+        shard_nodes, shard_edges)
+        for pkg, (shard_nodes, shard_edges) in sorted(shards.items())]
+    # Largest first, so that the last shards to finish are small ones
+    order = sorted(range(len(items)), key=lambda i: -len(items[i][2]))
+    jobs = params['jobs'] or os.cpu_count()
+    with stats.timer('write'):
+        if jobs > 1 and len(items) > 1:
+            import multiprocessing
+            with multiprocessing.Pool(min(jobs, len(items)), init_shard_worker,
+                    (settings, params, items)) as pool:
+                written = list(pool.imap_unordered(write_shard, order))
+        else:
+            init_shard_worker(settings, params, items)
+            written = list(map(write_shard, order))
+        overview_nodes, overview_edges = DOTShard.overview(shards, between,
+                settings['PACKAGE_COLORS'] or {}, params['bidir'])
+        # The packages are the nodes, so the legend is left out. Its node
+        # names would be the same.
+        make_writer({k: v for k, v in settings.items()
+            if k != 'PACKAGE_COLORS'}).write(f, overview_nodes, None,
+                overview_edges, params['buffer_size'])
+    for fname, shard_nodes, shard_edges in sorted(written):
+        logging.info('Shard %s: nodes %s, edges %s', fname, shard_nodes,
+                shard_edges)
+    stats.count('shards', len(items))
+    return nodes, index, edges
+
+
+def init_shard_worker(worker_settings, worker_params, items):
+    """
+    Sets up the globals of a process writing shards. The shards are given
+    to each process once, without copying them when the process is forked,
+    and the tasks are just their indexes.
+    """
+    global shard_items
+    init_worker(worker_settings, worker_params)
+    shard_items = items
+
+
+def write_shard(i):
+    """
+    Writes shard i of --shard-by, in a worker process with --jobs. Returns
+    the file name and the number of nodes and edges written.
+    """
+    fname, nodes, edges = shard_items[i]
+    with open(fname, output_mode(), buffering=params['buffer_size']) as f:
+        make_writer().write(f, nodes, None, edges, params['buffer_size'])
+    return fname, len(nodes), len(edges)
+
+
+def write_streaming(graph, writer, f, stats):
+    """
+    Writes a StreamingGraph to f, which cleans it up while writing.
+    """
+    logging.info('Filter list: %s', settings['FILTERED_EXACT_NODES'])
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug('Ignored nodes: %s',
+                '\n\t'.join(sorted(graph.ignored_nodes)))
+    try:
+        with stats.timer('write'):
+            nodes, edges = graph.write(writer, f, show_node,
+                    params['buffer_size'])
+    finally:
+        graph.close()
+    stats.count('nodes_merged', len(graph.nodes))
+    stats.count('ignored_nodes', len(graph.ignored_nodes))
+    stats.count('nodes_written', nodes)
+    stats.count('edges_written', edges)
+
+
+def write_output(graph, f, output, stats):
+    """
+    Writes graph to f with a new writer and closes f unless it is stdout.
+    With --shard-by the shards are named after output. Returns the cleaned
+    up nodes, EdgeIndex and edges, or None with --streaming.
+    """
+    try:
+        if params['shard_by'] == 'cluster':
+            return write_shards(graph, f, output, stats)
+        elif params['streaming']:
+            write_streaming(graph, make_writer(), f, stats)
+        else:
+            return write_graph(graph, make_writer(), f, stats)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def save_store(fname, cleaned, level, file_provenance, stats):
+    """
+    Saves the cleaned up graph of a level to the --store database.
+    """
+    import DOTStore
+    nodes, index, edges = cleaned
+    meta = {k: str(params[k]) for k in ('type', 'filter', 'bidir', 'header',
+        'directory')}
+    meta['level'] = str(level)
+    with stats.timer('store'):
+        DOTStore.save(fname, nodes, edges,
+                lambda x: packages.pkg_name(x.lower()).replace('.', ''),
+                file_provenance, meta)
+    logging.info('Saved %s nodes and %s edges to %s', len(nodes), len(edges),
+            fname)
+
+
+def level_output(name, level):
+    """
+    Returns the name of the output (or --store) file of a level of
+    --levels.
+    """
+    if '{level}' in name:
+        return name.replace('{level}', str(level))
+    root, ext = os.path.splitext(name)
+    return '{}.level{}{}'.format(root, level, ext)
+
+
+def write_stats(stats, graph):
+    """
+    Writes the --stats file.
+    """
+    if params['stats'] == '':
+        return
+    stats.filter_hits = {
+        'read': node_filter.count_hits(graph.ignored_nodes,
+            node_filter.read_pattern),
+        'cleanup': node_filter.count_hits(node_filter.cleaned_labels(),
+            node_filter.cleaned_pattern),
+    }
+    stats.write(params['stats'], params['stats_format'])
+
+
+def watch(cache=None):
+    """
+    Writes the output file and rewrites it whenever dot files are added,
+    changed or removed, until interrupted. Only those files are parsed
+    again. The new output is written to a temporary file that then replaces
+    the old one, so readers never see a partial file.
+    """
+    find_files = lambda: list(discover_files())
+    if params['files_from'] == '-':
+        # stdin can only be read once, so the list read first is kept
+        file_list = find_files()
+        find_files = lambda: file_list
+    watcher = DOTWatcher(find_files,
+            lambda files: read_file_results(files, cache), params['bidir'],
+            graph_type())
+    tmp_name = params['output'] + '.tmp'
+    try:
+        while True:
+            start = time.perf_counter()
+            stats = DOTStats()
+            with stats.timer('parse'):
+                changed = watcher.update()
+            if changed:
+                with stats.timer('merge'):
+                    graph = watcher.graph()
+                    if params['merge'] == 'batch':
+                        graph.consolidate()
+                with open(tmp_name, output_mode(),
+                        buffering=params['buffer_size']) as f:
+                    write_graph(graph, make_writer(), f, stats)
+                os.replace(tmp_name, params['output'])
+                if cache is not None:
+                    cache.commit()
+                stats.count('files', len(watcher.files))
+                write_stats(stats, graph)
+                logging.info('Wrote %s files to %s in %.3f s',
+                        len(watcher.files), params['output'],
+                        time.perf_counter() - start)
+            time.sleep(params['interval'])
+    except KeyboardInterrupt:
+        pass
+
+
+def query(argv):
+    """
+    dotcomb.py query: answers questions about a graph saved with --store
+    without reading the dot files again.
+    """
+    global params
+    global settings
+    global packages
+    p = argparse.ArgumentParser(prog='dotcomb.py query',
+            description='Query a graph saved with --store.')
+    p.add_argument('store', help='Database written with --store.')
+    sub = p.add_subparsers(dest='command', metavar='command')
+    sub.required = True
+    for name, direction in (('fan-in', 'to'), ('fan-out', 'from')):
+        q = sub.add_parser(name, help='Nodes with edges {} a node, or the '
+                'nodes with the most.'.format(direction))
+        q.add_argument('label', nargs='?', default='')
+        q.add_argument('--top', type=int, default=20)
+    q = sub.add_parser('path', help='Shortest path from a node to another.')
+    q.add_argument('start')
+    q.add_argument('end')
+    q.add_argument('--max-hops', type=int, default=-1)
+    sub.add_parser('packages', help='Number of edges between packages.')
+    q = sub.add_parser('files', help='Files a node was read from.')
+    q.add_argument('label')
+    q = sub.add_parser('dot', help='Write the graph, or a part of it, like a '
+            'normal run.')
+    q.add_argument('--focus', default='')
+    q.add_argument('--hops', type=int, default=1)
+    q.add_argument('--direction', choices=['in', 'out', 'both'],
+            default='both')
+    q.add_argument('--package', help='Comma separated packages to write.',
+            default='')
+    q.add_argument('--cluster', '-c', action='store_true', default=False)
+    q.add_argument('--header', default=None)
+    q.add_argument('--output', '-o', default='')
+    q.add_argument('--format', choices=FORMATS, default='dot')
+    q.add_argument('--settings', '-s', default='')
+    q.add_argument('--buffer-size', type=int, default=BUFFER_SIZE)
+    args = p.parse_args(argv)
+
+    from DOTStore import DOTStore
+    try:
+        store = DOTStore(args.store)
+    except FileNotFoundError:
+        p.error('no such database: {}'.format(args.store))
+    try:
+        if args.command in ('fan-in', 'fan-out'):
+            direction = 'in' if args.command == 'fan-in' else 'out'
+            if args.label == '':
+                for label, count in store.top_fan(direction, args.top):
+                    print('{}\t{}'.format(count, label))
+                return 0
+            i = store.node_id(args.label)
+            if i is None:
+                print('No node {}'.format(args.label), file=sys.stderr)
+                return 1
+            for label in store.fan(i, direction):
+                print(label)
+        elif args.command == 'path':
+            ids = [store.node_id(x) for x in (args.start, args.end)]
+            for label, i in zip((args.start, args.end), ids):
+                if i is None:
+                    print('No node {}'.format(label), file=sys.stderr)
+                    return 1
+            path = store.path(ids[0], ids[1], args.max_hops)
+            if path is None:
+                print('No path', file=sys.stderr)
+                return 1
+            print(' -> '.join(path))
+        elif args.command == 'packages':
+            for pkg1, pkg2, count in store.package_edges():
+                print('{}\t{} -> {}'.format(count, pkg1 or 'other',
+                    pkg2 or 'other'))
+        elif args.command == 'files':
+            i = store.node_id(args.label)
+            if i is None:
+                print('No node {}'.format(args.label), file=sys.stderr)
+                return 1
+            for fname in store.files(i):
+                print(fname)
+        elif args.command == 'dot':
+            if args.format in BINARY_FORMATS and args.output == '':
+                p.error('--format {} needs an output file (-o)'.format(
+                    args.format))
+            settings = DOTCombiner.load_settings(settings_file, args.settings)
+            packages = PackageResolver(settings)
+            header = args.header
+            if header is None:
+                header = store.meta().get('header', '')
+            params = {'cluster': args.cluster, 'header': header,
+                    'format': args.format, 'buffer_size': args.buffer_size}
+            ids = None
+            if args.focus != '':
+                ids = store.neighbourhood(store.find(
+                    [x.strip() for x in args.focus.split(',') if x.strip()]),
+                    args.hops, args.direction)
+            pkgs = None
+            if args.package != '':
+                pkgs = set([x.strip() for x in args.package.split(',')])
+            nodes, edges = store.graph(ids, pkgs)
+            f = sys.stdout
+            if args.output != '':
+                f = open(args.output, output_mode(),
+                        buffering=args.buffer_size)
+            try:
+                make_writer().write(f, nodes, EdgeIndex(edges), edges,
+                        args.buffer_size)
+            finally:
+                if f is not sys.stdout:
+                    f.close()
+    finally:
+        store.close()
+    return 0
 
 
 def main(argv):
     global params
     global settings
-    nodes = {}
-    edges = {}
-    ignored_nodes = {}
+    global node_filter
+    global packages
+    global profiler
+    global provenance
     orig_stdout = sys.stdout
     f_stdout = orig_stdout
 
-    logging.basicConfig(filename='dotcomb.log', filemode='w',
-            level=logging.INFO)
-
+    if argv[:1] == ['query']:
+        return query(argv[1:])
     params = read_params(argv)
-
-    if params['output'] != '':
-        f_stdout = open(params['output'], 'w')
+    logging.basicConfig(filename='dotcomb.log', filemode='w',
+            level=logging.DEBUG if params['verbose'] else logging.INFO)
+    stats = DOTStats()
+    if params['profile'] != '':
+        from DOTProfile import DOTProfiler
+        profiler = DOTProfiler(params['profile'], params['profile_top'])
+        stats.profiler = profiler
+    import yaml
+
+    if params['output'] != '' and not params['watch'] and not params['levels']:
+        f_stdout = open(params['output'], output_mode(),
+                buffering=params['buffer_size'])
 
     with open(settings_file, 'r') as f:
-        settings = yaml.load(f)
+        settings = yaml.safe_load(f)
 
     if params['settings'] != '':
         try:
             with open(params['settings'], 'r') as f:
-                alt_settings = yaml.load(f)
+                alt_settings = yaml.safe_load(f)
             settings = {**settings, **alt_settings}
         except FileNotFoundError:
-            print('File not found: {}', params['settings'], file=f_stdout)
-
-    if params['type'] == 'call_graph':
-        input_path = params['directory'] + '/**/*_cgraph*.dot'
-    elif params['type'] == 'collab':
-        input_path = params['directory'] + '/**/*__coll*.dot'
-
-    files = glob.glob(input_path, recursive=True)
-    for fname in files:
-        inp = FileStream(fname)
-        lexer = DOTLexer(inp)
-        stream = CommonTokenStream(lexer)
-        parser = DOTParser(stream)
-        tree = parser.graph()
-        printer = DOTReader(settings, params)
-        walker = ParseTreeWalker()
-        walker.walk(printer, tree)
-        nodes = {**nodes, **printer.nodes}
-        edges = {**edges, **printer.edges}
-        ignored_nodes = {**ignored_nodes, **printer.ignored_nodes}
-        logging.info('%s:\n\t\t nodes %s, edges %s, ignored: %s',
-                fname.split('/')[5:], len(printer.nodes),
-                len(printer._file_edges), len(printer.ignored_nodes))
-        #logging.debug("%s", pprint.pformat(printer.edges))
-        printer.next_file()
-
-    cleaned_edges = {}
-    cleaned_nodes = {}
-    for (n1, n2), edge in edges.items():
-        if show_node(n1) and show_node(n2):
-            if (n1 in nodes) and (n2 in nodes):
-                cleaned_edges[(n1, n2)] = edge
-    for key, node in nodes.items():
-        if has_edges(key, cleaned_edges):
-            cleaned_nodes[key] = node
+            print('File not found: {}', params['settings'],
+                    file=sys.stderr if 'b' in output_mode() else f_stdout)
 
-    # Print some info to log
-    logging.info('Nodes: %s, edges: %s', len(cleaned_nodes), len(cleaned_edges))
-    l = sorted(list(cleaned_nodes.keys()))
-    logging.info('Node list: %s', '\n\t'.join(l))
-    logging.info('Filter list: %s', settings['FILTERED_EXACT_NODES'])
-    l = sorted(list(ignored_nodes.keys()))
-    logging.info('Ignored nodes: %s', '\n\t'.join(l))
-
-    # Create dot file
-    header = settings['HEADER'].replace('$HEADER$', params['header'])
-    print("{}".format(header), file=f_stdout)
-    print_nodes(cleaned_nodes, edges, f_stdout)
-    print_edges(cleaned_edges, f_stdout)
-    if params['cluster'] is False and 'PACKAGE_COLORS' in settings:
-        print_legend(settings['PACKAGE_COLORS'], f_stdout)
-    print("{}".format(settings['FOOTER']), file=f_stdout)
+    if params['streaming']:
+        graphs = [StreamingGraph(params['bidir'], params['spill_edges'])
+                for p in level_params()]
+    else:
+        graphs = [graph_type()(params['bidir']) for p in level_params()]
+    cache = None
+    if params['cache'] != '':
+        from DOTCache import DOTCache
+        cache = DOTCache(params['cache'])
+    node_filter = DOTFilter(settings, params['filter'] is True)
+    packages = PackageResolver(settings)
+    if params['store'] != '':
+        from DOTStore import Provenance
+        provenance = [Provenance() for p in level_params()]
+    if params['watch']:
+        try:
+            watch(cache)
+        finally:
+            if cache is not None:
+                cache.close()
+        return
+    read_files(stats.timed(discover_files(), 'discover'), graphs, cache, stats)
+    if cache is not None:
+        stats.count('cache_hits', cache.hits)
+        stats.count('cache_misses', cache.misses)
+        cache.close()
+    if profiler is not None:
+        profiler.files_read()
+
+    if params['levels']:
+        for i, (level, graph) in enumerate(zip(params['levels'], graphs)):
+            output = level_output(params['output'], level)
+            logging.info('Writing level %s to %s', level, output)
+            cleaned = write_output(graph, open(output, output_mode(),
+                buffering=params['buffer_size']), output, stats)
+            if provenance is not None:
+                save_store(level_output(params['store'], level), cleaned,
+                        level, provenance[i], stats)
+    else:
+        cleaned = write_output(graphs[0], f_stdout, params['output'], stats)
+        if provenance is not None:
+            save_store(params['store'], cleaned, params['level'],
+                    provenance[0], stats)
+    write_stats(stats, graphs[0])
+    if profiler is not None:
+        profiler.close()
 
     sys.stdout = orig_stdout
 
 
 if __name__ == '__main__':
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))